@@ -0,0 +1,161 @@
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+# One fixed-size record per log line: byte offset just past the line, role code
+RECORD = struct.Struct("<QB")
+ROLE_CODES = {"Human": 1, "AI": 2, "Action": 3, "Prompt": 4}
+
+
+class LogIndex:
+    """Sidecar line index for a JSONL conversation log.
+
+    ``<log>.idx`` holds one record per line: the byte offset where the line
+    ends and a role code. Updating only reads the bytes appended since the
+    last update, and a page of entries is served by seeking into the index
+    and the log, so the cost of a page does not grow with the session.
+    ``<log>.idx.meta`` records which file (device, inode) was indexed, so a
+    log replaced by another file is indexed again even if it is larger.
+    """
+
+    def __init__(self, log_path):
+        self.log_path = Path(log_path)
+        self.index_path = self.log_path.with_name(self.log_path.name + ".idx")
+        self.meta_path = self.log_path.with_name(self.log_path.name + ".idx.meta")
+        self.lock = threading.Lock()
+        self.identity = None
+
+    def __len__(self):
+        try:
+            return self.index_path.stat().st_size // RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def read_records(self, start, stop, f=None):
+        """Records ``start..stop-1`` as (end_offset, role_code) tuples (``f``: open index file)."""
+        if stop <= start:
+            return []
+        if f is None:
+            with open(self.index_path, "rb") as f:
+                return self.read_records(start, stop, f)
+        f.seek(start * RECORD.size)
+        data = f.read((stop - start) * RECORD.size)
+        return list(RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]))
+
+    def indexed_size(self):
+        count = len(self)
+        return self.read_records(count - 1, count)[0][0] if count else 0
+
+    @staticmethod
+    def role_code(line):
+        try:
+            return ROLE_CODES.get(json.loads(line).get("role"), 0)
+        except (json.JSONDecodeError, AttributeError):
+            return 0
+
+    def indexed_identity(self):
+        if self.identity is None:
+            try:
+                with open(self.meta_path, "r", encoding="utf-8") as f:
+                    self.identity = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        return self.identity
+
+    def update(self):
+        """Index lines appended to the log since the last update."""
+        with self.lock:
+            try:
+                stat = self.log_path.stat()
+            except FileNotFoundError:
+                return
+            size = stat.st_size
+            identity = [stat.st_dev, stat.st_ino]
+            end = self.indexed_size()
+            if size < end or self.indexed_identity() != identity:
+                # A new, replaced or truncated log; index it from the start.
+                self.index_path.unlink(missing_ok=True)
+                end = 0
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump(identity, f)
+                self.identity = identity
+            if size == end:
+                return
+
+            with open(self.log_path, "rb") as f:
+                f.seek(end)
+                data = f.read(size - end)
+
+            records = []
+            pos = 0
+            while True:
+                newline = data.find(b"\n", pos)
+                if newline < 0:
+                    break  # a partly written last line is indexed once it is complete
+                records.append(RECORD.pack(end + newline + 1, self.role_code(data[pos:newline])))
+                pos = newline + 1
+            if records:
+                with open(self.index_path, "ab") as f:
+                    f.write(b"".join(records))
+
+    def page(self, cursor=0, limit=50, roles=None):
+        """Up to ``limit`` line numbers from ``cursor`` on, optionally only the given roles.
+
+        Returns ``(lines, next_cursor)``; ``next_cursor`` is where the next page
+        starts (equal to ``len(self)`` once the end of the log is reached).
+        """
+        codes = {ROLE_CODES[role] for role in roles if role in ROLE_CODES} if roles else None
+        count = len(self)
+        lines = []
+        position = cursor
+        while position < count and len(lines) < limit:
+            block = self.read_records(position, min(position + PAGE_SCAN_BLOCK, count))
+            for offset, (_, code) in enumerate(block):
+                if codes is None or code in codes:
+                    lines.append(position + offset)
+                    if len(lines) == limit:
+                        return lines, position + offset + 1
+            position += len(block)
+        return lines, position
+
+    def read_entries(self, lines):
+        """Parse the given log lines; malformed lines are left out."""
+        entries = []
+        if not lines:
+            return entries
+        with open(self.log_path, "rb") as f, open(self.index_path, "rb") as index_file:
+            for line in lines:
+                records = self.read_records(max(line - 1, 0), line + 1, index_file)
+                start = records[0][0] if line > 0 else 0
+                end = records[-1][0]
+                f.seek(start)
+                try:
+                    entry = json.loads(f.read(end - start))
+                except json.JSONDecodeError:
+                    continue
+                entry["line"] = line
+                entries.append(entry)
+        return entries
+
+
+def get_log_index(log_path):
+    """Shared LogIndex per log file, brought up to date with the log."""
+    key = os.path.abspath(log_path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = LogIndex(log_path)
+        index = _indexes[key]
+    index.update()
+    return index
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+PAGE_SCAN_BLOCK = 1024   # index records read per seek while filtering by role
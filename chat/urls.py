@@ -1,9 +1,13 @@
 from django.urls import path
-from .views import chat_page, chat_api, logs_view, process_audio
+from .views import chat_page, chat_api, chat_stream_api, logs_view, logs_api, log_entry_api, latency_api, process_audio
 
 urlpatterns = [
     path("", chat_page, name="chat_page"),
     path("api/", chat_api, name="chat_api"),
+    path("api/stream/", chat_stream_api, name="chat_stream_api"),
     path("logs/", logs_view, name="logs"),
+    path("logs/api/", logs_api, name="logs_api"),
+    path("logs/api/<int:line>/", log_entry_api, name="log_entry_api"),
+    path("latency/", latency_api, name="latency_api"),
     path("process_audio/", process_audio, name="process_audio"),
 ]
@@ -1,30 +1,60 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 import json
 import os
+from contextlib import aclosing
 from pathlib import Path
 import tempfile
 import datetime
+import uuid
 from dotenv import load_dotenv
 load_dotenv()
 
 from conversation_agent.fetch_disorders import Fetcher
 from conversation_agent.therapist_agent import Therapist
+from conversation_agent.session_manager import SessionManager, session_key
+from conversation_agent.log_writer import get_log_writer
 from utils.process_media import process_media,audio_to_text
+from chat.log_index import get_log_index
+from utils import tracing
+from utils.tracing import span
 
 isAssistant = os.getenv("THERAPIST_ASSISTANT", "False").lower() in ("true", "1", "t")
 mock = os.getenv("MOCK_MODE", "True").lower() in ("true", "1", "t")
+# Trust the X-Client-Id header for chat turns; only enable behind a gateway that sets it
+accept_client_id = os.getenv("ACCEPT_CLIENT_ID", "False").lower() in ("true", "1", "t")
 
 fetcher = Fetcher()
 
 
-therapist = Therapist(model_type="openai", fetcher=fetcher, isAssistant=isAssistant, mock=mock)
-log_file_name = f"{therapist.log_file}"
-LOG_FILE = Path(settings.BASE_DIR) / log_file_name  # adjust filename
+def create_therapist(session_id, log_file=None):
+    # Models, embeddings and the Fetcher are shared; each session gets its own memory and log
+    return Therapist(model_type="openai", fetcher=fetcher, isAssistant=isAssistant, mock=mock, session_id=session_id, log_file=log_file)
 
-print(f"Log file path: {LOG_FILE}")
+
+sessions = SessionManager(create_therapist)
+
+
+def get_session_id(request, allow_client_id=True):
+    """The client's own id (X-Client-Id header, with ACCEPT_CLIENT_ID) if it sends one, else its Django session."""
+    client_id = request.headers.get("X-Client-Id") if accept_client_id and allow_client_id else None
+    if client_id:
+        return client_id
+    if request.session.session_key is None:
+        request.session.create()
+    return request.session.session_key
+
+
+async def aget_session_id(request):
+    # Creating a Django session touches the database, which is sync-only
+    return await sync_to_async(get_session_id)(request)
+
+LOG_PAGE_SIZE = 50         # entries per page in the log viewer
+LOG_PAGE_MAX = 500
+LOG_PREVIEW_CHARS = 500    # longer detail fields are truncated in pages
 
 
 MEDIA_DIR = Path(settings.BASE_DIR) / "media"
@@ -36,47 +66,79 @@ VIDEO_DIR.mkdir(parents=True, exist_ok=True)
 def chat_page(request):
     return render(request, "chat/chat.html")
 
+def save_uploads(request, session_id):
+    """Save uploaded audio/video to the media folders; returns their paths (None if absent).
+
+    Names carry the session's key and a uuid, so concurrent uploads never
+    overwrite or get mistaken for each other.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    prefix = f"{timestamp}_{session_key(session_id)[:16]}_{uuid.uuid4().hex}"
+    audio_file = request.FILES.get("audio")
+    video_file = request.FILES.get("video")
+    audio_path = video_path = None
+
+    if audio_file:
+        audio_path = AUDIO_DIR / f"{prefix}_audio.webm"
+        with open(audio_path, "wb") as f:
+            for chunk in audio_file.chunks():
+                f.write(chunk)
+
+    if video_file:
+        video_path = VIDEO_DIR / f"{prefix}_video.webm"
+        with open(video_path, "wb") as f:
+            for chunk in video_file.chunks():
+                f.write(chunk)
+    return audio_path, video_path
+
+
+def transcribe_media(audio_path, video_path):
+    if audio_path is None and video_path is None:
+        return ""
+    aud, vid = process_media(audio_path, video_path)
+    return audio_to_text(aud) if aud else ""
+
+
+async def read_message(request, session_id):
+    """The user's message: form text plus the transcribed recording, or a JSON body."""
+    # Check if it's a file upload
+    if request.FILES:
+        user_message = request.POST.get("message", "")
+
+        # Save uploaded audio/video
+        audio_path, video_path = await sync_to_async(save_uploads, thread_sensitive=False)(request, session_id)
+
+        with span("media"):
+            text = await sync_to_async(transcribe_media, thread_sensitive=False)(audio_path, video_path)
+        return user_message + f"\n{text}"
+
+    # If not files, treat as JSON text
+    try:
+        data = json.loads(request.body.decode("utf-8"))
+        return data.get("message", "")
+    except Exception as e:
+        raise ValueError(str(e)) from e
+
+
 @csrf_exempt
-def chat_api(request):
+async def chat_api(request):
+    # Async view: under ASGI one process serves many conversations while they
+    # wait on the embedding, Pinecone and LLM calls; blocking work runs in threads.
     if request.method == "POST":
-        # Check if it's a file upload
-        if request.FILES:
-            user_message = request.POST.get("message", "")
-            timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-
-            # Save uploaded audio/video
-            audio_file = request.FILES.get("audio")
-            video_file = request.FILES.get("video")
-
-            if audio_file:
-                audio_path = AUDIO_DIR / f"{timestamp}_audio.webm"
-                with open(audio_path, "wb") as f:
-                    for chunk in audio_file.chunks():
-                        f.write(chunk)
-
-            if video_file:
-                video_path = VIDEO_DIR / f"{timestamp}_video.webm"
-                with open(video_path, "wb") as f:
-                    for chunk in video_file.chunks():
-                        f.write(chunk)
-
-            aud, vid = process_media()
-            text = audio_to_text(aud)
-            user_message += f"\n{text}"
-
-        else:
-            # If not files, treat as JSON text
-            try:
-                data = json.loads(request.body.decode("utf-8"))
-                user_message = data.get("message", "")
-            except Exception as e:
-                return JsonResponse({"error": "Invalid request format", "details": str(e)}, status=400)
+        session_id = await aget_session_id(request)
+        try:
+            user_message = await read_message(request, session_id)
+        except ValueError as e:
+            return JsonResponse({"error": "Invalid request format", "details": str(e)}, status=400)
 
         # Process the message via AI
-        if user_message.strip().upper() == "START":
-            ai_reply = therapist.proactive_start()
-        else:
-            ai_reply = therapist.ask(user_message)
+        with span("chat_api"):
+            async with sessions.ause(session_id) as session:
+                if user_message.strip().upper() == "START":
+                    ai_reply = await session.therapist.aproactive_start()
+                else:
+                    ai_reply = await session.therapist.aask(user_message)
+                await sync_to_async(session.monitor.routine, thread_sensitive=False)()
 
         # asyncio.run(process_media())
         print("Processing media files...")
@@ -85,8 +147,43 @@ def chat_api(request):
     return JsonResponse({"error": "Only POST allowed"}, status=400)
 
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@csrf_exempt
+async def chat_stream_api(request):
+    """``chat_api`` as server-sent events: ``transcript``, a ``token`` per
+    chunk of the reply as the model generates it, then ``done``."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST allowed"}, status=400)
+    # Resolved before responding, so a new session's cookie goes out with the headers
+    session_id = await aget_session_id(request)
+    try:
+        user_message = await read_message(request, session_id)
+    except ValueError as e:
+        return JsonResponse({"error": "Invalid request format", "details": str(e)}, status=400)
+    query = "" if user_message.strip().upper() == "START" else user_message
+
+    async def events():
+        yield sse("transcript", {"text": user_message})
+        chunks = []
+        async with sessions.ause(session_id) as session:
+            async with aclosing(session.therapist.astream(query)) as stream:
+                async for chunk in stream:
+                    chunks.append(chunk)
+                    yield sse("token", {"text": chunk})
+            await sync_to_async(session.monitor.routine, thread_sensitive=False)()
+        yield sse("done", {"reply": "".join(chunks).strip()})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"   # keep proxies from buffering the stream
+    return response
+
+
 @csrf_exempt
-def process_audio(request):
+async def process_audio(request):
     """
     Receive audio file from frontend, convert to text, and return AI response
     """
@@ -104,7 +201,8 @@ def process_audio(request):
         user_text = "dummy transcription"  # placeholder
 
         # Send to AI
-        ai_reply = therapist.ask(user_text)
+        async with sessions.ause(await aget_session_id(request)) as session:
+            ai_reply = await session.therapist.aask(user_text)
 
         return JsonResponse({"text": ai_reply})
     
@@ -114,12 +212,58 @@ def process_audio(request):
 
 
 def logs_view(request):
-    logs = []
-    if LOG_FILE.exists():
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    logs.append(json.loads(line.strip()))
-                except json.JSONDecodeError:
-                    continue
-    return render(request, "chat/logs.html", {"logs": logs})
+    # Entries are fetched page by page from logs_api by the template.
+    return render(request, "chat/logs.html", {"page_size": LOG_PAGE_SIZE})
+
+
+def preview_details(details):
+    """Shorten long string fields; the full entry is served by log_entry_api."""
+    truncated = False
+    preview = {}
+    for key, value in details.items():
+        if isinstance(value, str) and len(value) > LOG_PREVIEW_CHARS:
+            value = value[:LOG_PREVIEW_CHARS] + "…"
+            truncated = True
+        preview[key] = value
+    return preview, truncated
+
+
+def logs_api(request):
+    """One page of the session log: ?cursor=<line>&limit=<n>&role=Human,AI"""
+    try:
+        cursor = max(int(request.GET.get("cursor", 0)), 0)
+        limit = min(max(int(request.GET.get("limit", LOG_PAGE_SIZE)), 1), LOG_PAGE_MAX)
+    except ValueError as e:
+        return JsonResponse({"error": "Invalid cursor or limit", "details": str(e)}, status=400)
+    roles = [role.strip() for role in request.GET.get("role", "").split(",") if role.strip()]
+
+    # Logs are only served to the Django session that owns them, never by header
+    log_file = sessions.log_file(get_session_id(request, allow_client_id=False))
+    if log_file is None:
+        return JsonResponse({"entries": [], "next_cursor": 0, "total": 0})
+    get_log_writer().flush()
+    index = get_log_index(Path(settings.BASE_DIR) / log_file)
+    lines, next_cursor = index.page(cursor, limit, roles)
+    entries = index.read_entries(lines)
+    for entry in entries:
+        if isinstance(entry.get("details"), dict):
+            entry["details"], entry["truncated"] = preview_details(entry["details"])
+    return JsonResponse({"entries": entries, "next_cursor": next_cursor, "total": len(index)})
+
+
+def log_entry_api(request, line):
+    """A single log entry with its full details."""
+    log_file = sessions.log_file(get_session_id(request, allow_client_id=False))
+    if log_file is None:
+        return JsonResponse({"error": "No conversation in this session"}, status=404)
+    get_log_writer().flush()
+    index = get_log_index(Path(settings.BASE_DIR) / log_file)
+    entries = index.read_entries([line]) if line < len(index) else []
+    if not entries:
+        return JsonResponse({"error": f"No log entry at line {line}"}, status=404)
+    return JsonResponse(entries[0])
+
+
+def latency_api(request):
+    """Per-stage latency histograms of this process (empty unless TRACING is on)."""
+    return JsonResponse({"tracing": tracing.TRACING, "spans": tracing.snapshot(), "sessions": sessions.stats()})
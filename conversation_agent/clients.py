@@ -0,0 +1,145 @@
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+from pinecone import Pinecone
+from openai import AsyncOpenAI, OpenAI
+from dotenv import load_dotenv
+from conversation_agent.local_index import LocalIndex
+
+load_dotenv()
+
+
+# Process-wide client registry. Every Fetcher (and thread) asks here instead of
+# building its own clients, so HTTP connections stay alive and pooled across
+# instances and the Pinecone host lookup happens once per index.
+_lock = threading.Lock()
+_pinecone_client = None
+_openai_client = None
+_indexes = {}
+_local_indexes = {}
+_index_hosts = {}
+# Async clients hold connections bound to the event loop that opened them,
+# so they are kept per loop. They are only used under the ASGI entry point,
+# whose loop lives as long as the worker process; runserver/WSGI start a new
+# loop per request and would leave a client pair behind on every call.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_pinecone_client():
+    global _pinecone_client
+    with _lock:
+        if _pinecone_client is None:
+            _pinecone_client = Pinecone(api_key=PINECONE_API_KEY, pool_threads=POOL_SIZE)
+    return _pinecone_client
+
+
+def get_index(index_name):
+    """Shared Pinecone index handle backed by one urllib3 connection pool."""
+    pc = get_pinecone_client()
+    with _lock:
+        if index_name not in _indexes:
+            _indexes[index_name] = pc.Index(index_name, pool_threads=POOL_SIZE, connection_pool_maxsize=POOL_SIZE)
+        return _indexes[index_name]
+
+
+def get_local_index(index_dir=None):
+    """Shared LocalIndex, so the matrix is mapped and its metadata parsed once."""
+    with _lock:
+        if index_dir not in _local_indexes:
+            _local_indexes[index_dir] = LocalIndex(index_dir)
+        return _local_indexes[index_dir]
+
+
+def get_openai_client():
+    """Shared OpenAI client over a keep-alive httpx connection pool."""
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=POOL_SIZE,
+                    max_keepalive_connections=POOL_SIZE,
+                    keepalive_expiry=KEEPALIVE_SECONDS,
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS),
+            )
+            _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+    return _openai_client
+
+
+def get_index_host(index_name):
+    """Data-plane host of a Pinecone index, looked up once."""
+    with _lock:
+        host = _index_hosts.get(index_name)
+    if host is None:
+        host = get_pinecone_client().describe_index(index_name).host
+        with _lock:
+            _index_hosts[index_name] = host
+    return host
+
+
+def async_clients_enabled():
+    """True when the running event loop is long-lived (ASGI); otherwise async
+    code should call the pooled sync clients in a thread."""
+    return ASYNC_CLIENTS
+
+
+def loop_clients():
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.get(loop)
+        if clients is None:
+            clients = _async_clients[loop] = {}
+        return clients
+
+
+def get_async_openai_client():
+    """Shared AsyncOpenAI client of the running event loop."""
+    clients = loop_clients()
+    if "openai" not in clients:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE,
+                max_keepalive_connections=POOL_SIZE,
+                keepalive_expiry=KEEPALIVE_SECONDS,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS),
+        )
+        clients["openai"] = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+    return clients["openai"]
+
+
+async def get_async_index(index_name):
+    """Shared asyncio Pinecone index handle of the running event loop."""
+    clients = loop_clients()
+    key = ("index", index_name)
+    if key not in clients:
+        host = await asyncio.to_thread(get_index_host, index_name)
+        clients.setdefault(key, get_pinecone_client().IndexAsyncio(host=host))
+    return clients[key]
+
+
+def reset_clients():
+    """Drop every cached client (used by benchmarks to measure cold starts)."""
+    global _pinecone_client, _openai_client
+    with _lock:
+        if _openai_client is not None:
+            _openai_client.close()
+        _pinecone_client = None
+        _openai_client = None
+        _indexes.clear()
+        _local_indexes.clear()
+        _index_hosts.clear()
+        _async_clients.clear()
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "10"))
+KEEPALIVE_SECONDS = float(os.getenv("CLIENT_KEEPALIVE_SECONDS", "60"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("CLIENT_HTTP_TIMEOUT_SECONDS", "30"))
+ASYNC_CLIENTS = os.getenv("ASYNC_CLIENTS", "False").lower() in ("true", "1", "t")   # set by deepheal/asgi.py
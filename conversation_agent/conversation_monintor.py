@@ -1,13 +1,27 @@
 import json
+import os
 from datetime import datetime
 
 
 class ConversationMonitor:
-    def __init__(self, therapist=None):
+    """Tracks session length against time, message and token limits.
+
+    The conversation log is tailed: each ``routine()`` only parses the lines
+    appended since the previous call. With ``subscribe=True`` the monitor
+    instead receives entries straight from ``Therapist.write_log`` and never
+    reads the file.
+    """
+
+    def __init__(self, therapist=None, subscribe=False):
         self.therapist = therapist
         self.conversation_log = self.therapist.log_file if therapist else None
         self.set_limits()
         self.set_alerts()
+        self.subscribed = False
+        if subscribe and therapist is not None:
+            self.read_log()  # catch up on anything logged before subscribing
+            therapist.subscribe(self.on_log_entry)
+            self.subscribed = True
 
     def set_limits(self, time_limit=None, message_limit=None, token_limit=None, flag_range=0.2):
         self.time_limit = time_limit
@@ -16,8 +30,15 @@ class ConversationMonitor:
         self.flag_range = flag_range
         
         self.token_count = 0
+        self.memory_stats = {}
+        self.reset_tail()
+
+    def reset_tail(self):
         self.message_count = 0
         self.start_time = None
+        self.offset = 0
+        self.partial = b""
+        self.file_id = None
 
     def set_alerts(self):
         self.final_lap = False
@@ -35,20 +56,54 @@ class ConversationMonitor:
                 except json.JSONDecodeError as e:
                     print(f"Skipping malformed line: {e}")
 
-    def read_log(self):
-        count_msg = 0
-        for entry in self.read(self.conversation_log):
-            role = entry.get("role")
-            timestamp = entry.get("timestamp")
-            details = entry.get("details")
-
-            if role == "Human":
-                count_msg += 1
+    def on_log_entry(self, entry):
+        role = entry.get("role")
+        timestamp = entry.get("timestamp")
+
+        if role == "Human":
+            self.message_count += 1
+
+        if self.start_time is None:
+            self.start_time = timestamp
+
+    def read_new_lines(self, filepath):
+        """Yield entries appended since the last call.
+
+        A trailing line without its newline is kept back until it is complete.
+        If the file was replaced or truncated, counters restart from the top.
+        """
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+        if self.file_id is not None and (file_id != self.file_id or stat.st_size < self.offset):
+            self.reset_tail()
+        self.file_id = file_id
+
+        with open(filepath, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping malformed line: {e}")
 
-            if self.start_time is None:
-                self.start_time = timestamp
-        
-        self.message_count = count_msg
+    def read_log(self):
+        if self.subscribed or not self.conversation_log:
+            return
+        if self.therapist is not None:
+            self.therapist.flush_log()
+        for entry in self.read_new_lines(self.conversation_log):
+            self.on_log_entry(entry)
 
 
     def update_alerts(self):
@@ -80,7 +135,20 @@ class ConversationMonitor:
 
 
 
+    def read_tokens(self):
+        """Take the session's running token total from the therapist's ledger."""
+        if self.therapist is not None:
+            self.token_count = self.therapist.token_ledger.total_tokens
+
+    def read_memory(self):
+        """Size of the context the model actually receives (summary + verbatim window)."""
+        memory = self.therapist.therapist.memory if self.therapist is not None else None
+        if hasattr(memory, "stats"):
+            self.memory_stats = memory.stats()
+
     def routine(self):
         self.read_log()
+        self.read_tokens()
+        self.read_memory()
         self.update_alerts()
 
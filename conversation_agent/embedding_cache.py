@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """Bounded in-memory LRU/TTL cache for query embeddings.
+
+    Keys are ``(model_type, model_name, normalized_text)``. Entries older than
+    ``ttl`` seconds are treated as misses (``ttl=None`` disables expiry).
+    Misses fall through to the caller's compute function; the Fetcher routes
+    those through the on-disk ``EmbeddingStore``.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.encode_time = 0.0
+
+    @staticmethod
+    def normalize(text):
+        """Unicode-normalize and collapse whitespace so trivially equal queries share a key."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def make_key(self, model_type, model_name, text):
+        return (model_type, model_name, self.normalize(text))
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                vector, stored_at = entry
+                if self.ttl is None or now - stored_at <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self.entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, key, vector):
+        with self.lock:
+            self.entries[key] = (vector, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute_fn):
+        """Return the cached vector for ``key`` or compute, store and return it."""
+        vector = self.get(key)
+        if vector is not None:
+            return vector
+        start = time.perf_counter()
+        vector = compute_fn()
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.encode_time += elapsed
+        self.put(key, vector)
+        return vector
+
+    def get_or_compute_many(self, keys, compute_fn):
+        """Batched lookup: ``compute_fn`` receives the distinct missing keys and
+        must return their vectors in the same order, in a single call."""
+        vectors = {}
+        missing = {}
+        for key in keys:
+            if key in vectors or key in missing:
+                continue
+            vector = self.get(key)
+            if vector is None:
+                missing[key] = None
+            else:
+                vectors[key] = vector
+
+        if missing:
+            start = time.perf_counter()
+            missing = list(missing)
+            computed = compute_fn(missing)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.encode_time += elapsed
+            for key, vector in zip(missing, computed):
+                self.put(key, vector)
+                vectors[key] = vector
+        return [vectors[key] for key in keys]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Hit/miss counters; ``saved_seconds`` estimates encoder time avoided by hits."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            avg_encode = self.encode_time / self.misses if self.misses else 0.0
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "encode_seconds": self.encode_time,
+                "saved_seconds": avg_encode * self.hits,
+            }
+
+
+def get_query_cache():
+    """Process-wide cache shared by every Fetcher instance."""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = EmbeddingCache(
+                maxsize=EMBED_CACHE_SIZE,
+                ttl=EMBED_CACHE_TTL,
+            )
+    return _query_cache
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL")) if os.getenv("EMBED_CACHE_TTL") else None   # seconds
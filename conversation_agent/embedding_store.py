@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+import numpy as np
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class EmbeddingStore:
+    """Content-addressed on-disk embedding store for one embedding model.
+
+    Vectors are keyed by ``sha256(text)`` and kept in memory-mapped ``.npy``
+    shards under ``<root>/<model>/``; ``index.json`` maps each hash to its
+    ``[shard, row]``. Only hashes are persisted, never the texts themselves.
+    The indexer and the retriever share it, so a given text is encoded once
+    per model.
+    """
+
+    def __init__(self, model_name, root=None):
+        self.model_name = model_name
+        self.dir = Path(root or EMBED_STORE_DIR) / re.sub(r"[^a-zA-Z0-9_.-]", "_", model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.dir / "index.json"
+        self.lock = threading.Lock()
+        self.shards = {}
+        self.hits = 0
+        self.misses = 0
+        self.load_index()
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def load_index(self):
+        self.index = {}
+        if self.index_file.exists():
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    def save_index(self):
+        tmp_file = self.dir / f"index.{uuid.uuid4().hex}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_file, self.index_file)
+
+    def shard(self, name):
+        if name not in self.shards:
+            self.shards[name] = np.load(self.dir / name, mmap_mode="r")
+        return self.shards[name]
+
+    def lookup(self, digest):
+        location = self.index.get(digest)
+        if location is None:
+            return None
+        try:
+            return self.shard(location[0])[location[1]].tolist()
+        except FileNotFoundError:
+            # Another process compacted the shards; pick up its index.
+            self.shards.clear()
+            self.load_index()
+            location = self.index.get(digest)
+            return self.shard(location[0])[location[1]].tolist() if location else None
+
+    def get_many(self, texts):
+        """Return stored vectors (as lists) in input order, ``None`` where missing."""
+        vectors = []
+        with self.lock:
+            for text in texts:
+                vector = self.lookup(self.text_hash(text))
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                vectors.append(vector)
+        return vectors
+
+    def put_many(self, texts, vectors):
+        """Append vectors as one new shard and record their hashes."""
+        hashes = {}
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                digest = self.text_hash(text)
+                if digest not in self.index:
+                    hashes.setdefault(digest, vector)
+            rows = list(hashes.values())
+            if not rows:
+                return
+
+            shard_name = f"shard_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}.npy"
+            np.save(self.dir / shard_name, np.asarray(rows, dtype=np.float32))
+
+            # Merge with whatever other processes wrote since we loaded.
+            on_disk = self.index
+            self.load_index()
+            on_disk.update(self.index)
+            self.index = on_disk
+            for row, digest in enumerate(hashes):
+                self.index[digest] = [shard_name, row]
+            self.save_index()
+
+            if len({name for name, _ in self.index.values()}) > MAX_SHARDS:
+                self.compact()
+
+    def get_or_compute_many(self, texts, compute_fn, persist=True):
+        """Read-through lookup: ``compute_fn`` gets the missing texts in one call.
+
+        With ``persist=False`` the store is only read; computed vectors are
+        returned but not written back.
+        """
+        texts = list(texts)
+        vectors = self.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, compute_fn(missing)))
+            if persist:
+                self.put_many(missing, [computed[text] for text in missing])
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def compact(self):
+        """Rewrite all shards into one (called with the lock held)."""
+        digests = list(self.index)
+        matrix = np.stack([self.shard(self.index[d][0])[self.index[d][1]] for d in digests]) if digests else np.empty((0, 0), dtype=np.float32)
+        old_shards = {name for name, _ in self.index.values()}
+        shard_name = f"shard_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}.npy"
+        np.save(self.dir / shard_name, matrix)
+        self.index = {digest: [shard_name, row] for row, digest in enumerate(digests)}
+        self.save_index()
+
+        self.shards.clear()
+        for name in old_shards:
+            try:
+                os.remove(self.dir / name)
+            except OSError:
+                pass  # still mapped by another process; left for the next compaction
+
+    def stats(self):
+        with self.lock:
+            return {
+                "model": self.model_name,
+                "vectors": len(self.index),
+                "shards": len({name for name, _ in self.index.values()}),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def get_embedding_store(model_name):
+    """Process-wide store per embedding model."""
+    with _stores_lock:
+        if model_name not in _stores:
+            _stores[model_name] = EmbeddingStore(model_name)
+        return _stores[model_name]
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+EMBED_STORE_DIR = os.getenv("EMBED_STORE_DIR", "embeddings")
+MAX_SHARDS = int(os.getenv("EMBED_STORE_MAX_SHARDS", "64"))
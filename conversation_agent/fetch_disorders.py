@@ -1,118 +1,245 @@
 # Install required packages
 # pip install pinecone-client openai
 
+import asyncio
 import os
-from pinecone import Pinecone, ServerlessSpec
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-from conversation_agent.load_models import ModelLoader
+from conversation_agent.load_models import ModelLoader, embed_model_id
+from conversation_agent.clients import async_clients_enabled, get_async_index, get_async_openai_client, get_index, get_local_index, get_openai_client, reset_clients
+from conversation_agent.embedding_cache import get_query_cache
+from conversation_agent.embedding_store import get_embedding_store
+from utils.tracing import span
 
 load_dotenv()
 
 
+_embed_executor = None
+
+
+def get_embed_executor():
+    """Threads that run local embedding models for async callers, off the event loop."""
+    global _embed_executor
+    if _embed_executor is None:
+        _embed_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+    return _embed_executor
+
+
 class Fetcher:
-    def __init__(self, model_type="SentenceTransformer"):
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        self.index = pc.Index(INDEX_NAME)
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, model_type="SentenceTransformer", backend=None):
+        self.backend = backend or FETCHER_BACKEND
+        if self.backend == "local":
+            self.index = get_local_index()
+        elif self.backend == "pinecone":
+            self.index = get_index(INDEX_NAME)
+        else:
+            raise ValueError(f"Unknown Fetcher backend: {self.backend} (expected 'pinecone' or 'local')")
+        self.openai_client = get_openai_client() if model_type == "OpenAI" else None
         self.model_type = model_type
         if model_type == "SentenceTransformer":
             self.embed_model = SENTENCE_TRANSFORMER_EMBED_MODEL
+            self.embed_model_id = embed_model_id(self.embed_model)
         elif model_type == "OpenAI":
             self.embed_model = OPENAI_EMBED_MODEL
+            self.embed_model_id = self.embed_model
+        self.cache = get_query_cache()
+        self.embedding_store = get_embedding_store(self.embed_model_id)
 
     def embed_text(self, text: str, model):
-        """Create embeddings from text."""
+        """Create embeddings from text, reusing cached vectors for repeated queries."""
+        return self.embed_texts([text], model)[0]
+
+    def embed_texts(self, texts, model):
+        """Create embeddings for many texts: in-memory cache, then the on-disk
+        embedding store, then one batched encoder call for what is left.
+
+        The store holds the indexed corpus; queries only read from it and are
+        written back only with PERSIST_QUERY_EMBEDDINGS (patient text stays off disk).
+        """
+        keys = [self.cache.make_key(self.model_type, self.embed_model_id, text) for text in texts]
+        return self.cache.get_or_compute_many(
+            keys,
+            lambda missing: self.embedding_store.get_or_compute_many(
+                [key[2] for key in missing],
+                lambda new_texts: self.encode_texts(new_texts, model),
+                persist=PERSIST_QUERY_EMBEDDINGS,
+            ),
+        )
+
+    def get_model(self, model):
+        if not model:
+            model_loader = ModelLoader()
+            model = model_loader.load_embed_model(embed_model_type=self.model_type)
+        return model
+
+    def encode_texts(self, texts, model):
+        """Run the embedding model on a list of texts in a single call."""
         if self.model_type == "OpenAI":
             emb = self.openai_client.embeddings.create(
                 model=self.embed_model,
-                input=text
+                input=list(texts)
             )
-            return emb.data[0].embedding
+            return [d.embedding for d in sorted(emb.data, key=lambda d: d.index)]
         elif self.model_type == "SentenceTransformer":
-            if not model:
-                model_loader = ModelLoader()    
-                model = model_loader.load_embed_model(embed_model_type=self.model_type)
-            vector = model.encode(text, convert_to_tensor=False).tolist()
+            model = self.get_model(model)
+            vectors = model.encode(list(texts), batch_size=EMBED_BATCH_SIZE, convert_to_tensor=False)
+            return vectors.tolist()
+
+    async def aembed_text(self, text, model=None):
+        """Async ``embed_text``: OpenAI embeddings are awaited under ASGI; local
+        models (and OpenAI outside ASGI) run on the embed executor."""
+        if self.model_type != "OpenAI" or not async_clients_enabled():
+            return await asyncio.get_running_loop().run_in_executor(get_embed_executor(), self.embed_text, text, model)
+        key = self.cache.make_key(self.model_type, self.embed_model_id, text)
+        vector = self.cache.get(key)
+        if vector is not None:
             return vector
+        # The store lock can be held by a writer; never wait for it on the event loop
+        vector = (await asyncio.to_thread(self.embedding_store.get_many, [text]))[0]
+        if vector is None:
+            emb = await get_async_openai_client().embeddings.create(model=self.embed_model, input=[text])
+            vector = emb.data[0].embedding
+            if PERSIST_QUERY_EMBEDDINGS:
+                await asyncio.to_thread(self.embedding_store.put_many, [text], [vector])
+        self.cache.put(key, vector)
+        return vector
+
+    def format_matches(self, response, top_k):
+        """Aggregate chunk hits back to disorders with max or sum pooling.
+
+        Matches arrive sorted by score, so the first match of each disorder is
+        its best chunk and supplies the metadata. Vectors indexed before
+        chunking have no ``parent_id`` and stand for themselves.
+        """
+        matches = response['matches']
+        if not matches:
+            return []
+
+        parents = np.array([(match.get('metadata') or {}).get('parent_id', match['id']) for match in matches])
+        scores = np.array([match['score'] for match in matches], dtype=np.float64)
+        disorder_ids, first, group = np.unique(parents, return_index=True, return_inverse=True)
+
+        if CHUNK_POOLING == "sum":
+            pooled = np.bincount(group, weights=scores, minlength=len(disorder_ids))
+        else:
+            pooled = np.full(len(disorder_ids), -np.inf)
+            np.maximum.at(pooled, group, scores)
 
-    def fetch(self, query_text, model=None, top_k = 10):
-        query_embedding = self.embed_text(query_text, model)
-
-        response = self.index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
-        
         results = []
-        for match in response['matches']:
+        for g in np.argsort(-pooled, kind="stable")[:top_k]:
             results.append({
-                "id": match['id'],
-                "score": match['score'],
-                "metadata": match.get('metadata', {})
+                "id": str(disorder_ids[g]),
+                "score": float(pooled[g]),
+                "metadata": matches[first[g]].get('metadata', {})
             })
         return results
-    
+
+    def query_many(self, vectors, top_k):
+        """Run one index lookup per vector; local lookups share one matmul,
+        Pinecone lookups are issued concurrently."""
+        if self.backend == "local":
+            return self.index.query_many(vectors, top_k=top_k, include_metadata=True)
+        with ThreadPoolExecutor(max_workers=min(QUERY_WORKERS, len(vectors))) as pool:
+            return list(pool.map(
+                lambda vector: self.index.query(vector=vector, top_k=top_k, include_metadata=True),
+                vectors,
+            ))
+
+    def fetch(self, query_text, model=None, top_k = 10):
+        with span("fetch.embed"):
+            query_embedding = self.embed_text(query_text, model)
+
+        with span("fetch.query"):
+            response = self.index.query(
+                vector=query_embedding,
+                top_k=top_k * CHUNK_OVERSAMPLE,
+                include_metadata=True
+            )
+        with span("fetch.format"):
+            return self.format_matches(response, top_k)
+
+    async def afetch(self, query_text, model=None, top_k=10):
+        """Async ``fetch``: waits on OpenAI / Pinecone without holding a thread."""
+        with span("fetch.embed"):
+            query_embedding = await self.aembed_text(query_text, model)
+
+        with span("fetch.query"):
+            if self.backend == "local" or not async_clients_enabled():
+                # In-process matmul, or the pooled sync client outside ASGI; run it beside the loop
+                response = await asyncio.to_thread(self.index.query, vector=query_embedding, top_k=top_k * CHUNK_OVERSAMPLE, include_metadata=True)
+            else:
+                index = await get_async_index(INDEX_NAME)
+                response = await index.query(vector=query_embedding, top_k=top_k * CHUNK_OVERSAMPLE, include_metadata=True)
+        with span("fetch.format"):
+            return self.format_matches(response, top_k)
+
+    def fetch_many(self, queries, model=None, top_k=10):
+        """Batched `fetch`: returns one result list per query, in input order."""
+        queries = list(queries)
+        if not queries:
+            return []
+        with span("fetch.embed"):
+            query_embeddings = self.embed_texts(queries, model)
+        with span("fetch.query"):
+            responses = self.query_many(query_embeddings, top_k * CHUNK_OVERSAMPLE)
+        with span("fetch.format"):
+            return [self.format_matches(response, top_k) for response in responses]
+
 
 
 
 # -----------------------------
 # Configuration
 # -----------------------------
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENV = "us-east-1"
 INDEX_NAME = "deepheal-disorders"
+FETCHER_BACKEND = os.getenv("FETCHER_BACKEND", "pinecone")   # "pinecone" or "local"
 OPENAI_EMBED_MODEL = "text-embedding-3-large"
 SENTENCE_TRANSFORMER_EMBED_MODEL = "BAAI/bge-large-en-v1.5"
+EMBED_BATCH_SIZE = 32
+QUERY_WORKERS = 8
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))   # threads running local embedding models for async requests
+PERSIST_QUERY_EMBEDDINGS = os.getenv("PERSIST_QUERY_EMBEDDINGS", "False").lower() in ("true", "1", "t")   # also store query vectors on disk
+CHUNK_POOLING = os.getenv("CHUNK_POOLING", "max")   # "max" or "sum" over a disorder's chunk scores
+CHUNK_OVERSAMPLE = 4                                # chunk matches fetched per requested disorder
 
 
 import time
 
 if __name__ == "__main__":
-    t1 = time.time()
+    # Cold vs warm latency: the first round pays for client construction, the
+    # Pinecone host lookup and fresh TLS connections; later rounds build a new
+    # Fetcher each time but reuse the pooled clients. The in-memory embedding
+    # cache is cleared once up front and shared by every Fetcher, so only the
+    # first round pays for encoding the query (query vectors are not written
+    # to the on-disk store unless PERSIST_QUERY_EMBEDDINGS is set).
     query_text = "I am having insomnia. Can not sleep at night."
-
-    fetcher = Fetcher()
-    results = fetcher.fetch(query_text, top_k=2)
-    
-    print("Top Results:")
-    for i, res in enumerate(results, 1):
-        print(f"{i}. ID: {res['id']}, Score: {res['score']}, Metadata: {res['metadata']}")
-
-    t2 = time.time()
-    print(f"\n\nNEXT\n")
-    query_text = "I am having insomnia. Can not sleep at night."
-
-    fetcher = Fetcher()
-    results = fetcher.fetch(query_text, top_k=2)
-    
-    print("Top Results:")
-    for i, res in enumerate(results, 1):
-        print(f"{i}. ID: {res['id']}, Score: {res['score']}, Metadata: {res['metadata']}")
-
-    t3 = time.time()
-    print(f"\n\nNEXT\n")
-    query_text = "I am having insomnia. Can not sleep at night."
-
-    fetcher = Fetcher()
-    results = fetcher.fetch(query_text, top_k=2)
-    
-    print("Top Results:")
-    for i, res in enumerate(results, 1):
-        print(f"{i}. ID: {res['id']}, Score: {res['score']}, Metadata: {res['metadata']}")
-
-    t4 = time.time()
-    print(f"\n\nNEXT\n")
-    query_text = "I am having insomnia. Can not sleep at night."
-
-    fetcher = Fetcher()
-    results = fetcher.fetch(query_text, top_k=2)
-    
-    print("Top Results:")
-    for i, res in enumerate(results, 1):
-        print(f"{i}. ID: {res['id']}, Score: {res['score']}, Metadata: {res['metadata']}")
-    t5 = time.time()
-
-    print(f"\n\nTimes:\nT1: {t2-t1}\nT2: {t3-t2}\nT3: {t4-t3}\nT4: {t5-t4}\n")
\ No newline at end of file
+    rounds = 5
+
+    reset_clients()
+    get_query_cache().clear()
+    timings = []
+    for r in range(rounds):
+        t1 = time.time()
+        fetcher = Fetcher()
+        t2 = time.time()
+        results = fetcher.fetch(query_text, top_k=2)
+        t3 = time.time()
+        timings.append((t2 - t1, t3 - t2))
+
+        if r == 0:
+            print("Top Results:")
+            for i, res in enumerate(results, 1):
+                print(f"{i}. ID: {res['id']}, Score: {res['score']}, Metadata: {res['metadata']}")
+
+    print("\n\nTimes (init / fetch):")
+    for r, (init_time, fetch_time) in enumerate(timings):
+        label = "cold" if r == 0 else "warm"
+        print(f"Round {r + 1} ({label}): {init_time:.4f}s / {fetch_time:.4f}s")
+    warm = timings[1:]
+    if warm:
+        print(f"Warm average: {sum(t for t, _ in warm) / len(warm):.4f}s / {sum(t for _, t in warm) / len(warm):.4f}s")
+    print(f"Embedding cache: {fetcher.cache.stats()}")
+    print(f"Embedding store: {fetcher.embedding_store.stats()}")
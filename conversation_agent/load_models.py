@@ -1,11 +1,13 @@
 import os
 import sys
+from pathlib import Path
 from openai import OpenAI
 from sentence_transformers import SentenceTransformer
 from langchain_community.llms import Ollama
 from langchain_openai import ChatOpenAI
 from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
+from conversation_agent.memory import build_memory
+from conversation_agent.therapist_chain import TherapistChain
 from dotenv import load_dotenv
 from functools import lru_cache
 import warnings
@@ -17,9 +19,81 @@ load_dotenv()
 
 
 _embed_model = None
-_therapist = None
+_therapist_model = None
 _therapist_assistant_model = None
 
+def resolve_device(device=None):
+    """Pick the embedding device: explicit value, else EMBED_DEVICE, else auto-detect."""
+    device = device or EMBED_DEVICE
+    if device != "auto":
+        return device
+    import torch
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def embed_model_id(model_name=None, precision=None):
+    """Name used to key caches and stores, so vectors from different precisions never mix."""
+    model_name = model_name or SENTENCE_TRANSFORMER_EMBED_MODEL
+    precision = precision or EMBED_PRECISION
+    return model_name if precision == "fp32" else f"{model_name}@{precision}"
+
+
+def build_embed_model(model_name=None, device=None, precision=None, threads=None):
+    """Load a SentenceTransformer for the given device and precision.
+
+    precision:
+        "fp32"       full precision (reference)
+        "fp16"/"bf16" half precision weights (fp16 only pays off on GPU)
+        "int8"       torch dynamic int8 quantization of Linear layers (CPU)
+        "onnx"       ONNX Runtime backend (CPU)
+        "onnx-int8"  ONNX Runtime with a dynamically quantized int8 export (CPU)
+    """
+    import torch
+
+    model_name = model_name or SENTENCE_TRANSFORMER_EMBED_MODEL
+    device = resolve_device(device)
+    precision = precision or EMBED_PRECISION
+    threads = threads or EMBED_THREADS
+    if threads:
+        torch.set_num_threads(threads)
+
+    print(f"Embedding model: {model_name} | Device: {device} | Precision: {precision}")
+
+    if precision == "onnx":
+        return SentenceTransformer(model_name, device=device, backend="onnx")
+
+    if precision == "onnx-int8":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        export_dir = Path(ONNX_EXPORT_DIR) / model_name.replace("/", "__")
+        quantized_file = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+        if not (export_dir / quantized_file).exists():
+            print(f"Exporting int8 ONNX model to {export_dir}...")
+            model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+            model.save(str(export_dir))
+            export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, str(export_dir))
+        return SentenceTransformer(str(export_dir), device=device, backend="onnx", model_kwargs={"file_name": quantized_file})
+
+    model = SentenceTransformer(model_name, device=device)
+    if precision == "fp16":
+        if device == "cpu":
+            print("Warning: fp16 inference on CPU is usually slower than fp32; consider bf16 or int8.")
+        model = model.half()
+    elif precision == "bf16":
+        model = model.to(torch.bfloat16)
+    elif precision == "int8":
+        if device != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif precision != "fp32":
+        raise ValueError(f"Unknown embedding precision: {precision}")
+    return model
+
+
 class ModelLoader:
     def __init__(self):
         pass
@@ -37,16 +111,16 @@ class ModelLoader:
         if _embed_model is None:
             print("Loading Embedding Model into Memory...")
             if self.embed_model_type == "SentenceTransformer":
-                _embed_model = SentenceTransformer(self.embed_model, device="cuda")
+                _embed_model = build_embed_model(self.embed_model)
         return _embed_model
     
 
-    @lru_cache(maxsize=1)
     def load_therapist(self, therapist_thinker_model_type="ollama", model="gpt-oss:latest", temp=0.6):
+        """A therapist chain with its own memory; the LLM behind it is loaded once and shared."""
         self.therapist_thinker_model_type = therapist_thinker_model_type
 
-        global _therapist
-        if _therapist is None:
+        global _therapist_model
+        if _therapist_model is None:
             print("Loading Therapist Thinker Model into Memory...")
 
             if self.therapist_thinker_model_type == "ollama":
@@ -54,28 +128,16 @@ class ModelLoader:
 
                 print(f"Model Specs:\nModel:{self.therapist_thinker_model}\n")
 
-                memory = ConversationBufferMemory(memory_key="history", return_messages=True)
                 _therapist_model = Ollama(model=self.therapist_thinker_model, base_url="http://localhost:11434")
-                _therapist = ConversationChain(
-                    llm=_therapist_model,
-                    memory=memory,
-                    # verbose=True
-                )
 
             if self.therapist_thinker_model_type == "openai":
                 self.therapist_thinker_model = model if model == "gpt-4o-mini" or model == "gpt-4.1-mini" else "gpt-4.1-mini"
                 
                 print(f"Therapist Agent Model Specs:\nModel:{self.therapist_thinker_model}\n")
 
-                memory = ConversationBufferMemory(memory_key="history", return_messages=True)
                 _therapist_model = ChatOpenAI(model_name=self.therapist_thinker_model, temperature=temp, openai_api_key=os.getenv("OPENAI_API_KEY"))
-                _therapist = ConversationChain(
-                    llm=_therapist_model,
-                    memory=memory,
-                    # verbose=True
-                )
 
-        return _therapist
+        return TherapistChain(llm=_therapist_model, memory=build_memory(_therapist_model))
 
     @lru_cache(maxsize=1)
     def load_therapist_assistant(self, therapist_assistant_model_type="ollama", model="gpt-oss:latest", temp=0.6):
@@ -114,3 +176,8 @@ class ModelLoader:
 
 OPENAI_EMBED_MODEL = "text-embedding-3-large"
 SENTENCE_TRANSFORMER_EMBED_MODEL = "BAAI/bge-large-en-v1.5"
+EMBED_DEVICE = os.getenv("EMBED_DEVICE", "auto")            # "auto", "cuda", "mps" or "cpu"
+EMBED_PRECISION = os.getenv("EMBED_PRECISION", "fp32")      # "fp32", "fp16", "bf16", "int8", "onnx", "onnx-int8"
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))        # 0 = torch default
+ONNX_EXPORT_DIR = os.getenv("ONNX_EXPORT_DIR", "onnx_models")
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx2")  # "arm64", "avx2", "avx512" or "avx512_vnni"
@@ -0,0 +1,131 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+
+class LocalIndex:
+    """In-process cosine index over a memory-mapped float32 matrix.
+
+    Mirrors the subset of the Pinecone ``Index`` API used by the Fetcher and
+    the VDB indexer (``upsert``, ``delete``, ``query``,
+    ``describe_index_stats``), plus a batched ``query_many``, so it can be
+    swapped in without changing the calling code.
+    """
+
+    def __init__(self, index_dir=None):
+        self.index_dir = Path(index_dir or LOCAL_INDEX_DIR)
+        self.vectors_file = self.index_dir / "vectors.npy"
+        self.meta_file = self.index_dir / "metadata.json"
+        self.load()
+
+    def load(self):
+        """Memory-map the stored matrix and load ids and metadata."""
+        self.ids = []
+        self.metadata = []
+        self.matrix = None
+        if self.vectors_file.exists() and self.meta_file.exists():
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.ids = meta["ids"]
+            self.metadata = meta["metadata"]
+            self.matrix = np.load(self.vectors_file, mmap_mode="r")
+        self.positions = {vid: i for i, vid in enumerate(self.ids)}
+
+    def save(self, matrix):
+        """Write matrix and metadata atomically, then re-map from disk."""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_vectors = self.index_dir / "vectors.tmp.npy"
+        tmp_meta = self.index_dir / "metadata.tmp.json"
+        np.save(tmp_vectors, matrix)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "metadata": self.metadata}, f, ensure_ascii=False)
+        self.matrix = None  # release the old mapping so the file can be replaced (Windows)
+        os.replace(tmp_vectors, self.vectors_file)
+        os.replace(tmp_meta, self.meta_file)
+        self.load()
+
+    @staticmethod
+    def normalize(vectors):
+        """Return L2-normalized float32 rows."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, vectors):
+        """Insert or replace vectors given as Pinecone-style dicts."""
+        if not vectors:
+            return {"upserted_count": 0}
+        new_rows = self.normalize([v["values"] for v in vectors])
+        if self.matrix is not None and new_rows.shape[1] != self.matrix.shape[1]:
+            raise ValueError(f"Vector dimension {new_rows.shape[1]} does not match index dimension {self.matrix.shape[1]}")
+
+        matrix = np.array(self.matrix) if self.matrix is not None else np.empty((0, new_rows.shape[1]), dtype=np.float32)
+        appended = []
+        for row, vec in zip(new_rows, vectors):
+            pos = self.positions.get(vec["id"])
+            if pos is None:
+                self.positions[vec["id"]] = len(self.ids)
+                self.ids.append(vec["id"])
+                self.metadata.append(vec.get("metadata", {}))
+                appended.append(row)
+            else:
+                matrix[pos] = row
+                self.metadata[pos] = vec.get("metadata", {})
+        if appended:
+            matrix = np.vstack([matrix, np.stack(appended)])
+
+        self.save(matrix)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids):
+        """Remove vectors by id; unknown ids are ignored."""
+        drop = {self.positions[vid] for vid in ids if vid in self.positions}
+        if not drop:
+            return {}
+        keep = [i for i in range(len(self.ids)) if i not in drop]
+        matrix = np.array(self.matrix[keep])
+        self.ids = [self.ids[i] for i in keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self.save(matrix)
+        return {}
+
+    def query(self, vector, top_k=10, include_metadata=True):
+        """Exact cosine top-k: one matmul plus argpartition."""
+        return self.query_many([vector], top_k=top_k, include_metadata=include_metadata)[0]
+
+    def query_many(self, vectors, top_k=10, include_metadata=True):
+        """Exact cosine top-k for a batch of queries with a single matmul."""
+        queries = self.normalize(vectors)
+        if self.matrix is None or len(self.ids) == 0:
+            return [{"matches": []} for _ in range(len(queries))]
+
+        scores = queries @ self.matrix.T
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        responses = []
+        for row_ids, row_scores in zip(top, top_scores):
+            matches = []
+            for i, score in zip(row_ids, row_scores):
+                match = {"id": self.ids[i], "score": float(score)}
+                if include_metadata:
+                    match["metadata"] = self.metadata[i]
+                matches.append(match)
+            responses.append({"matches": matches})
+        return responses
+
+    def describe_index_stats(self):
+        dimension = self.matrix.shape[1] if self.matrix is not None else 0
+        return {"dimension": dimension, "total_vector_count": len(self.ids)}
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index/deepheal-disorders")
@@ -0,0 +1,129 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_FLUSH = object()
+
+
+class LogWriter:
+    """Appends log lines from a background thread.
+
+    ``write`` only enqueues the line. The writer thread waits up to
+    ``flush_interval`` seconds (or ``batch_size`` lines) to batch entries,
+    then appends each file's lines with a single open/write. ``fsync`` is
+    "never" (leave it to the OS) or "always" (fsync after every batch).
+    Lines are written in the order they were queued, and the queue is
+    drained at interpreter exit.
+    """
+
+    def __init__(self, flush_interval=None, batch_size=None, fsync=None):
+        self.flush_interval = LOG_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.batch_size = batch_size or LOG_BATCH_SIZE
+        self.fsync = fsync or LOG_FSYNC
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, path, line):
+        with self.lock:
+            if not self.closed:
+                self.queue.put((path, line))
+                return
+        self.write_batch([(path, line)])
+
+    def flush(self, timeout=None):
+        """Block until the lines queued before this call are on disk.
+
+        Waits for a marker rather than for the whole queue, so lines other
+        sessions keep adding cannot hold the caller. Gives up after
+        ``timeout`` seconds (LOG_FLUSH_TIMEOUT); returns whether the lines were written.
+        """
+        done = threading.Event()
+        with self.lock:
+            if self.closed:
+                return True
+            self.queue.put((_FLUSH, done))
+        return done.wait(LOG_FLUSH_TIMEOUT if timeout is None else timeout)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and batch[-1][0] is not _FLUSH and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            lines = [item for item in batch if item is not None and item[0] is not _FLUSH]
+            try:
+                self.write_batch(lines)
+            except Exception as e:
+                print(f"Log writer failed to write {len(lines)} entries: {e}")
+            if batch[-1] is not None and batch[-1][0] is _FLUSH:
+                batch[-1][1].set()
+            if batch[-1] is None:
+                return
+
+    def write_batch(self, items):
+        lines = {}
+        for path, line in items:
+            lines.setdefault(path, []).append(line)
+        for path, file_lines in lines.items():
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(file_lines))
+                if self.fsync == "always":
+                    f.flush()
+                    os.fsync(f.fileno())
+
+
+class SyncLogWriter:
+    """Writes each line immediately on the caller's thread (``LOG_WRITER=sync``)."""
+
+    def write(self, path, line):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def flush(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+
+def get_log_writer():
+    """Process-wide log writer shared by every Therapist."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SyncLogWriter() if LOG_WRITER == "sync" else LogWriter()
+        return _writer
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+LOG_WRITER = os.getenv("LOG_WRITER", "buffered")                  # "buffered" or "sync"
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.2"))  # seconds a batch may wait for more entries
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "64"))
+LOG_FSYNC = os.getenv("LOG_FSYNC", "never")                       # "never" or "always"
+LOG_FLUSH_TIMEOUT = float(os.getenv("LOG_FLUSH_TIMEOUT", "5"))      # longest a reader waits for its entries
@@ -0,0 +1,142 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+from langchain.memory import ConversationBufferMemory
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+from utils.token_count import count_tokens
+
+
+# One background thread does all summarization, so it never runs on a request.
+_summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summarizer")
+
+
+SUMMARY_PROMPT = """Progressively summarize the conversation between a therapist (AI) and a patient (Human), adding onto the previous summary and returning a new summary.
+Keep what the patient shared about their feelings, symptoms, history and circumstances, and the topics the therapist has already explored. Be concise.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+
+class RollingSummaryMemory(ConversationBufferMemory):
+    """Conversation memory bounded by a token budget.
+
+    ``chat_memory`` still holds the full transcript, but the model only sees
+    a running summary plus the most recent messages. Once the verbatim window
+    grows past ``max_token_limit``, everything except the last ``keep_turns``
+    exchanges is folded into the summary by a background thread; until that
+    finishes, turns are served from the previous (longer) window, never blocked.
+    """
+
+    llm: Any = None
+    max_token_limit: int = 2000
+    keep_turns: int = 4
+    summary: str = ""
+    summarized_upto: int = 0
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _pending: Any = PrivateAttr(default=None)
+
+    @property
+    def summary_message(self) -> List[BaseMessage]:
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}")] if self.summary else []
+
+    @property
+    def buffer_as_messages(self) -> List[BaseMessage]:
+        with self._lock:
+            return self.summary_message + self.chat_memory.messages[self.summarized_upto:]
+
+    @property
+    def buffer_as_str(self) -> str:
+        return get_buffer_string(self.buffer_as_messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+
+    def window_tokens(self) -> int:
+        return sum(count_tokens(message.content) for message in self.chat_memory.messages[self.summarized_upto:])
+
+    def fold_cutoff(self):
+        """Index up to which messages should be folded, or None if the window fits the budget."""
+        cutoff = len(self.chat_memory.messages) - 2 * self.keep_turns
+        if cutoff <= self.summarized_upto or self.window_tokens() <= self.max_token_limit:
+            return None
+        return cutoff
+
+    def save_context(self, inputs, outputs) -> None:
+        super().save_context(inputs, outputs)
+        with self._lock:
+            if self._pending is not None and not self._pending.done():
+                return  # the running fold re-checks the budget when it finishes
+            if self.fold_cutoff() is not None:
+                self._pending = _summarizer.submit(self.fold)
+
+    def fold(self):
+        """Fold older messages into the running summary until the window fits the budget."""
+        while True:
+            with self._lock:
+                cutoff = self.fold_cutoff()
+                if cutoff is None:
+                    return
+                summary = self.summary
+                new_lines = get_buffer_string(self.chat_memory.messages[self.summarized_upto:cutoff], human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+            try:
+                result = self.llm.invoke(SUMMARY_PROMPT.format(summary=summary or "(none)", new_lines=new_lines))
+            except Exception as e:
+                print(f"Memory summarization failed, keeping the full window: {e}")
+                return
+            with self._lock:
+                self.summary = getattr(result, "content", result).strip()
+                self.summarized_upto = cutoff
+
+    def wait(self):
+        """Block until a pending summarization has finished (for tests and shutdown)."""
+        pending = self._pending
+        if pending is not None:
+            pending.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            window = self.chat_memory.messages[self.summarized_upto:]
+            summary = self.summary
+            total = len(self.chat_memory.messages)
+        summary_tokens = count_tokens(summary) if summary else 0
+        window_tokens = sum(count_tokens(message.content) for message in window)
+        return {
+            "summary_tokens": summary_tokens,
+            "window_tokens": window_tokens,
+            "context_tokens": summary_tokens + window_tokens,
+            "window_messages": len(window),
+            "summarized_messages": total - len(window),
+            "total_messages": total,
+        }
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self.summarized_upto = 0
+
+
+def build_memory(llm):
+    """Therapist memory per THERAPIST_MEMORY: "summary" (token-budgeted) or "buffer" (full history)."""
+    if THERAPIST_MEMORY == "buffer":
+        return ConversationBufferMemory(memory_key="history", return_messages=True)
+    return RollingSummaryMemory(
+        llm=llm,
+        memory_key="history",
+        return_messages=True,
+        max_token_limit=MEMORY_TOKEN_LIMIT,
+        keep_turns=MEMORY_KEEP_TURNS,
+    )
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+THERAPIST_MEMORY = os.getenv("THERAPIST_MEMORY", "summary")         # "summary" or "buffer"
+MEMORY_TOKEN_LIMIT = int(os.getenv("MEMORY_TOKEN_LIMIT", "2000"))   # verbatim history budget before folding
+MEMORY_KEEP_TURNS = int(os.getenv("MEMORY_KEEP_TURNS", "4"))        # exchanges always kept verbatim
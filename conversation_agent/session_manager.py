@@ -0,0 +1,227 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
+from pathlib import Path
+from conversation_agent.conversation_monintor import ConversationMonitor
+
+
+def session_key(session_id):
+    """File-safe, collision-free name for a session id (its SHA-256)."""
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+
+async def to_thread_or_undo(fn, undo):
+    """Run ``fn`` in a thread. If the caller is cancelled (client gone) before
+    it returns, ``fn`` still completes and ``undo(result)`` is called on it."""
+    future = asyncio.ensure_future(asyncio.to_thread(fn))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() or undo(f.result()))
+        raise
+
+
+class Session:
+    """One client's conversation: its Therapist (memory, log file) and monitor.
+
+    ``lock`` serializes turns of the same session; ``users`` counts requests
+    holding it out of the manager, which keeps it from being spilled.
+    """
+
+    def __init__(self, session_id, therapist):
+        self.session_id = session_id
+        self.therapist = therapist
+        self.monitor = ConversationMonitor(therapist=therapist, subscribe=True)
+        self.lock = threading.Lock()
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """Per-client Therapist sessions kept in an LRU.
+
+    ``factory(session_id, log_file=None)`` builds a Therapist; the heavy
+    objects behind it (LLMs, embedding model, Fetcher) are shared, so a
+    session only costs its memory and bookkeeping. At most ``max_sessions``
+    stay in memory; the least recently used, and any idle for longer than
+    ``idle_seconds``, are spilled to ``spill_dir`` as JSON and restored on
+    their next request. Sessions still in use are never spilled.
+    """
+
+    def __init__(self, factory, max_sessions=None, spill_dir=None, idle_seconds=None):
+        self.factory = factory
+        self.max_sessions = max_sessions or MAX_SESSIONS
+        self.spill_dir = Path(spill_dir or SESSION_SPILL_DIR)
+        self.idle_seconds = SESSION_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.sessions = OrderedDict()
+        self.busy = {}   # session id -> Event set once its load or spill has finished
+        self.lock = threading.Lock()
+        atexit.register(self.spill_all)
+
+    def spill_path(self, session_id):
+        return self.spill_dir / f"{session_key(session_id)}.json"
+
+    def checkout(self, session_id):
+        """Get the session (restoring or creating it) and mark it in use.
+
+        Building, restoring and spilling run outside the manager lock, so a
+        slow one never holds up other clients. A request for a session that
+        is being loaded or spilled waits for that to finish first.
+        """
+        while True:
+            with self.lock:
+                session = self.sessions.get(session_id)
+                if session is not None:
+                    self.sessions.move_to_end(session_id)
+                    session.users += 1
+                    evicted = self.evict()
+                    break
+                pending = self.busy.get(session_id)
+                if pending is None:
+                    self.busy[session_id] = threading.Event()
+            if pending is not None:
+                pending.wait()
+                continue
+            try:
+                session = self.restore(session_id) or Session(session_id, self.factory(session_id))
+                with self.lock:
+                    self.sessions[session_id] = session
+                    session.users += 1
+                    evicted = self.evict()
+            finally:
+                with self.lock:
+                    self.busy.pop(session_id).set()
+            break
+        self.spill_evicted(evicted)
+        return session
+
+    def checkin(self, session):
+        with self.lock:
+            session.users -= 1
+            session.last_used = time.monotonic()
+
+    @contextmanager
+    def use(self, session_id):
+        """``with sessions.use(session_id) as session:`` one turn of that session."""
+        session = self.checkout(session_id)
+        try:
+            with session.lock:
+                yield session
+        finally:
+            self.checkin(session)
+
+    @asynccontextmanager
+    async def ause(self, session_id):
+        """``async with sessions.ause(session_id) as session:`` from async views.
+
+        Restoring a session and waiting for its turn happen in threads, so the
+        event loop keeps serving other sessions meanwhile.
+        """
+        session = await to_thread_or_undo(partial(self.checkout, session_id), self.checkin)
+        try:
+            if not session.lock.acquire(blocking=False):
+                await to_thread_or_undo(session.lock.acquire, lambda _: session.lock.release())
+            try:
+                yield session
+            finally:
+                session.lock.release()
+        finally:
+            self.checkin(session)
+
+    def log_file(self, session_id):
+        """Log file of a session, live or spilled, without waiting on its turn."""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                return session.therapist.log_file
+            pending = self.busy.get(session_id)
+            path = self.spill_path(session_id)
+        if pending is not None:
+            pending.wait()
+            return self.log_file(session_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["log_file"]
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            # Restored (and its spill file removed) since the first look
+            session = self.sessions.get(session_id)
+            return session.therapist.log_file if session is not None else None
+
+    def restore(self, session_id):
+        path = self.spill_path(session_id)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        therapist = self.factory(session_id, log_file=state["log_file"])
+        therapist.load_state(state)
+        path.unlink()  # the live session is the copy now
+        return Session(session_id, therapist)
+
+    def spill(self, session):
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_path(session.session_id)
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session.therapist.export_state(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Take sessions past the LRU cap or idle too long out of the LRU and
+        return them (called with the lock held); ``spill_evicted`` writes them."""
+        now = time.monotonic()
+        overflow = len(self.sessions) - self.max_sessions
+        evicted = []
+        for session_id, session in list(self.sessions.items()):
+            idle = self.idle_seconds and now - session.last_used > self.idle_seconds
+            if session.users or (overflow <= 0 and not idle):
+                continue  # in use sessions are retried on a later request
+            del self.sessions[session_id]
+            self.busy[session_id] = threading.Event()
+            evicted.append(session)
+            overflow -= 1
+        return evicted
+
+    def spill_evicted(self, evicted):
+        for session in evicted:
+            try:
+                self.spill(session)
+            except Exception as e:
+                print(f"Could not spill session {session.session_id}, keeping it in memory: {e}")
+                with self.lock:
+                    self.sessions[session.session_id] = session
+            finally:
+                with self.lock:
+                    self.busy.pop(session.session_id).set()
+
+    def spill_all(self):
+        with self.lock:
+            for session in self.sessions.values():
+                self.spill(session)
+
+    def stats(self):
+        spilled = len(list(self.spill_dir.glob("*.json"))) if self.spill_dir.exists() else 0
+        with self.lock:
+            return {
+                "active": len(self.sessions),
+                "spilled": spilled,
+                "max_sessions": self.max_sessions,
+            }
+
+
+# -----------------------------
+# Configuration
+# -----------------------------
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "64"))                      # sessions kept in memory
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))  # idle sessions are spilled to disk
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", "sessions")
@@ -2,16 +2,21 @@
 from conversation_agent.load_models import ModelLoader
 from conversation_agent.fetch_disorders import Fetcher
 from conversation_agent.therapist_assistant import TherapistAssistant
-from utils.token_count import count_tokens
+from conversation_agent.log_writer import get_log_writer
+from conversation_agent.session_manager import session_key
+from utils.token_count import TokenLedger
+from utils.tracing import span, trace
+from langchain_core.messages import messages_from_dict, messages_to_dict
 from dotenv import load_dotenv
 from datetime import datetime
+from contextlib import aclosing
 import json
-import os
+import uuid
 
 load_dotenv()
 
 class Therapist:
-    def __init__(self, model_type="ollama", model="gpt-oss:latest", isAssistant=True, fetcher=None, logging=True, mock=False):
+    def __init__(self, model_type="ollama", model="gpt-oss:latest", isAssistant=True, fetcher=None, logging=True, mock=False, session_id=None, log_file=None):
         self.therapist_model_type = model_type
         if model_type == "ollama":
             self.therapist_model = model or "gpt-oss:latest"
@@ -31,14 +36,47 @@ class Therapist:
             self.fetcher = fetcher
 
         self.logging = logging
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_file = f"logs/conv_{timestamp}.json"
-
-        if os.path.exists(self.log_file):
-            print(f"Log file {self.log_file} already exists. Removing it.")
-            os.remove(self.log_file)
+        self.session_id = session_id
+        if log_file is not None:
+            # Restored session: keep appending to its existing log
+            self.log_file = log_file
+        else:
+            # A hash of the session id keeps concurrent sessions apart; without one, a random suffix does
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            suffix = session_key(session_id) if session_id else uuid.uuid4().hex[:8]
+            self.log_file = f"logs/conv_{timestamp}_{suffix}.json"
 
         self.mock = mock
+        self.token_ledger = TokenLedger()
+        self.log_listeners = []
+        self.log_writer = get_log_writer()
+
+    def export_state(self):
+        """JSON-serializable conversation state, for spilling an idle session to disk."""
+        memory = self.therapist.memory
+        return {
+            "session_id": self.session_id,
+            "log_file": self.log_file,
+            "messages": messages_to_dict(memory.chat_memory.messages),
+            "summary": getattr(memory, "summary", ""),
+            "summarized_upto": getattr(memory, "summarized_upto", 0),
+            "tokens": self.token_ledger.snapshot(),
+        }
+
+    def load_state(self, state):
+        memory = self.therapist.memory
+        memory.chat_memory.messages = messages_from_dict(state["messages"])
+        if hasattr(memory, "summary"):
+            memory.summary = state.get("summary", "")
+            memory.summarized_upto = state.get("summarized_upto", 0)
+        tokens = state.get("tokens", {})
+        self.token_ledger.input_tokens = tokens.get("input_tokens", 0)
+        self.token_ledger.output_tokens = tokens.get("output_tokens", 0)
+        self.token_ledger.calls = tokens.get("calls", 0)
+
+    def subscribe(self, callback):
+        """Call ``callback(log_entry)`` for every entry written to the log."""
+        self.log_listeners.append(callback)
 
     def write_log(self, role, info={}, action_name=""):
         if self.logging and len(info.keys()) > 0:
@@ -56,74 +94,182 @@ class Therapist:
                     "timestamp": datetime.now().isoformat(),
                 }
 
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+            with span("log"):
+                self.log_writer.write(self.log_file, json.dumps(log_entry, ensure_ascii=False) + "\n")
+
+            for callback in self.log_listeners:
+                callback(log_entry)
 
-    def get_system_prompt(self, query="", disorder_context=""):
+    def flush_log(self):
+        """Wait until every queued log entry has been written to the log file."""
+        self.log_writer.flush()
+
+    def get_system_prompt(self):
+        """The static system prompt, logged once at the start of the conversation."""
+        prompt = self.therapist.system_prompt
         if len(self.therapist.memory.chat_memory.messages) == 0:
-            with open(f"prompts/therapist_initial_prompt.txt", 'r') as f:
-                self.initial_system_prompt = f.read()
-            with open(f"prompts/therapist_intermediate_prompt.txt", 'r') as f:
-                self.intermediate_system_prompt = f.read()
-
-            prompt = f"{self.initial_system_prompt}"
-            self.write_log('Prompt', {"prompt": prompt})
-            return prompt
-
-        prompt = f"{self.intermediate_system_prompt}\n"
-        if self.disorder_context and disorder_context:
-            prompt += f"\n{disorder_context}\n"
-        prompt += f"Patient Response: {query}"
-        self.write_log("Prompt", {"prompt": self.intermediate_system_prompt})
+            self.write_log("Prompt", {"prompt": prompt})
         return prompt
 
+    def wants_disorder_context(self):
+        return self.disorder_context and len(self.therapist.memory.chat_memory.messages) > 2
+
+    def summarize_matches(self, results, threshold):
+        summary_results = "Possible Disorder Matches:\n"
+        log_results = ""
+
+        for i, res in enumerate(results, 1):
+            title = res['id']
+            score = res['score']
+            criteria = res['metadata']['diagnostic_criteria']
+            
+            if score > threshold:
+                summary_results += f"Disorder Match {i}. {title} (Score: {score:.2f})\nDiagnostic Criteria: {criteria}\n"
+                log_results += f"{i}. ID: {title}, Score: {score:.2f}"
+
+        self.write_log("Action", {"response": log_results}, "Fetcher")
+        return summary_results, log_results
+
     def fetch_disorder_info(self, query, top_k=5, threshold=0.59):
-        if self.disorder_context and len(self.therapist.memory.chat_memory.messages) > 2:
-            results = self.fetcher.fetch(query, top_k=top_k)
-            summary_results = "Possible Disorder Matches:\n"
-            log_results = ""
-
-            for i, res in enumerate(results, 1):
-                title = res['id']
-                score = res['score']
-                criteria = res['metadata']['diagnostic_criteria']
-                
-                if score > threshold:
-                    summary_results += f"Disorder Match {i}. {title} (Score: {score:.2f})\nDiagnostic Criteria: {criteria}\n"
-                    log_results += f"{i}. ID: {title}, Score: {score:.2f}"
-
-            self.write_log("Action", {"response": log_results}, "Fetcher")
-            return self.assistant(summary_results, log_results)
+        if self.wants_disorder_context():
+            with span("fetch"):
+                results = self.fetcher.fetch(query, top_k=top_k)
+            return self.assistant(*self.summarize_matches(results, threshold))
         return ""
+
+    async def afetch_disorder_info(self, query, top_k=5, threshold=0.59):
+        if self.wants_disorder_context():
+            with span("fetch"):
+                results = await self.fetcher.afetch(query, top_k=top_k)
+            return await self.aassistant(*self.summarize_matches(results, threshold))
+        return ""
+
+    def use_assistant(self, log_results):
+        return self.isAssistant and len(log_results.strip()) > 0
+
+    def log_assistant(self, assistant_response, assistant_prompt):
+        with span("tokens"):
+            input_tokens, output_tokens = self.token_ledger.record(assistant_prompt, assistant_response)
+        self.write_log("Action", {"response": assistant_response, "input": assistant_prompt, "Input_tokens": input_tokens, "Output_tokens": output_tokens}, "Therapist_Assistant")
+        return assistant_response
     
     def assistant(self, summary_results, log_results):
-        if not self.isAssistant or len(log_results.strip()) == 0:
+        if not self.use_assistant(log_results):
             return summary_results
-        assistant_response, assistant_prompt = self.therapist_assistant.help(summary_results, self.therapist.memory.chat_memory.messages)
-        self.write_log("Action", {"response": assistant_response, "input": assistant_prompt, "Input_tokens": count_tokens(assistant_prompt), "Output_tokens": assistant_response}, "Therapist_Assistant")
-        return assistant_response
+        with span("assistant"):
+            assistant_response, assistant_prompt = self.therapist_assistant.help(summary_results, self.therapist.memory.chat_memory.messages)
+        return self.log_assistant(assistant_response, assistant_prompt)
+
+    async def aassistant(self, summary_results, log_results):
+        if not self.use_assistant(log_results):
+            return summary_results
+        with span("assistant"):
+            assistant_response, assistant_prompt = await self.therapist_assistant.ahelp(summary_results, self.therapist.memory.chat_memory.messages)
+        return self.log_assistant(assistant_response, assistant_prompt)
+
+    def reply_info(self, prompt, response):
+        with span("tokens"):
+            input_tokens, output_tokens = self.token_ledger.record(prompt, response)
+        return {"response": response, "Input_tokens": input_tokens, "Output_tokens": output_tokens}
+
+    def log_reply(self, info, spans):
+        if spans is not None:
+            # Per-stage milliseconds of this turn (tracing on, TRACING=true)
+            info["Spans_ms"] = spans
+        self.write_log("AI", info)
+        return info["response"]
 
 
     def proactive_start(self):
-        prompt = self.get_system_prompt("")
-        if not self.mock:
-            response = self.therapist.run(prompt)
-        else:
-            response = "A: Proactive start"
-        self.write_log("AI", {"response": response, "Input_tokens": count_tokens(prompt), "Output_tokens": count_tokens(response)})
-        return response
+        with trace("turn") as spans:
+            self.get_system_prompt()
+            prompt = self.therapist.prompt_text()
+            with span("llm"):
+                if not self.mock:
+                    response = self.therapist.run()
+                else:
+                    response = "A: Proactive start"
+            info = self.reply_info(prompt, response)
+        return self.log_reply(info, spans)
+
+    async def aproactive_start(self):
+        with trace("turn") as spans:
+            self.get_system_prompt()
+            prompt = self.therapist.prompt_text()
+            with span("llm"):
+                if not self.mock:
+                    response = await self.therapist.arun()
+                else:
+                    response = "A: Proactive start"
+            info = self.reply_info(prompt, response)
+        return self.log_reply(info, spans)
     
 
+    async def astream(self, query=""):
+        """Stream a turn: yields the reply in chunks as they are generated
+        (an empty ``query`` is the proactive start).
+
+        The reply is logged and its tokens counted once the stream ends; if the
+        client goes away mid-reply, the part generated so far is accounted for
+        and logged as interrupted.
+        """
+        chunks = []
+        info = None
+        prompt = None
+        try:
+            with trace("turn") as spans:
+                disorder_context = ""
+                if query:
+                    self.write_log("Human", {"query": query})
+                    disorder_context = await self.afetch_disorder_info(query)
+                self.get_system_prompt()
+                prompt = self.therapist.prompt_text(query, disorder_context)
+                with span("llm"):
+                    if not self.mock:
+                        async with aclosing(self.therapist.astream(query, disorder_context)) as stream:
+                            async for chunk in stream:
+                                chunks.append(chunk)
+                                yield chunk
+                    else:
+                        for word in (f"B: User: {query}" if query else "A: Proactive start").split(" "):
+                            chunks.append(word if not chunks else " " + word)
+                            yield chunks[-1]
+                info = self.reply_info(prompt, "".join(chunks).strip())
+        finally:
+            if info is None and chunks:
+                info = self.reply_info(prompt, "".join(chunks).strip())
+                info["Interrupted"] = True
+            if info is not None:
+                self.log_reply(info, spans)
+
     def ask(self, query, casual=False):
-        self.write_log("Human", {"query": query})
+        with trace("turn") as spans:
+            self.write_log("Human", {"query": query})
 
-        disorder_context = self.fetch_disorder_info(query)
-        prompt = self.get_system_prompt(query, disorder_context)
-        if not self.mock:
-            response = self.therapist.run(prompt)
-        else:
-            response = f"B: User: {query}"
-        
-        self.write_log("AI", {"response": response, "Input_tokens": count_tokens(prompt), "Output_tokens": count_tokens(response)})    
-        return response
-    
+            disorder_context = self.fetch_disorder_info(query)
+            self.get_system_prompt()
+            # Retrieval context is sent with this turn only and never stored in memory
+            prompt = self.therapist.prompt_text(query, disorder_context)
+            with span("llm"):
+                if not self.mock:
+                    response = self.therapist.run(query, disorder_context)
+                else:
+                    response = f"B: User: {query}"
+            info = self.reply_info(prompt, response)
+        return self.log_reply(info, spans)
+
+    async def aask(self, query, casual=False):
+        """``ask`` for async views: the fetch, assistant and therapist calls are awaited."""
+        with trace("turn") as spans:
+            self.write_log("Human", {"query": query})
+
+            disorder_context = await self.afetch_disorder_info(query)
+            self.get_system_prompt()
+            prompt = self.therapist.prompt_text(query, disorder_context)
+            with span("llm"):
+                if not self.mock:
+                    response = await self.therapist.arun(query, disorder_context)
+                else:
+                    response = f"B: User: {query}"
+            info = self.reply_info(prompt, response)
+        return self.log_reply(info, spans)
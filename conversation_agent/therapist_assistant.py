@@ -1,4 +1,5 @@
 from conversation_agent.load_models import ModelLoader
+from utils.tracing import span
 from dotenv import load_dotenv
 from datetime import datetime
 import json
@@ -44,7 +45,7 @@ class TherapistAssistant:
         )
         return system_prompt
 
-    def help(self, fetched_disorders, memory, casual=False):
+    def build_prompt(self, fetched_disorders, memory):
         last_convo = []
         if not memory:
             print("No conversation history found.")
@@ -52,12 +53,24 @@ class TherapistAssistant:
             last_two = memory[-2:] if len(memory) >= 2 else memory[-len(memory):]
             for msg in last_two:
                 last_convo.append(msg.content)
+        return self.get_system_prompt(fetched_disorders, last_convo)
+
+    def help(self, fetched_disorders, memory, casual=False):
+        prompt = self.build_prompt(fetched_disorders, memory)
+        with span("assistant.llm"):
+            response = self.run(prompt)
+        return response, prompt
 
-        prompt = self.get_system_prompt(fetched_disorders, last_convo)
-        response = self.run(prompt)
+    async def ahelp(self, fetched_disorders, memory, casual=False):
+        prompt = self.build_prompt(fetched_disorders, memory)
+        with span("assistant.llm"):
+            response = await self.arun(prompt)
         return response, prompt
     
     def run(self, prompt):
         response = self.therapist_assistant.invoke(prompt)
         return response.content
-  
\ No newline at end of file
+
+    async def arun(self, prompt):
+        response = await self.therapist_assistant.ainvoke(prompt)
+        return response.content
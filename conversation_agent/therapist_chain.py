@@ -0,0 +1,76 @@
+from functools import lru_cache
+from pathlib import Path
+from langchain_core.messages import HumanMessage, SystemMessage, get_buffer_string
+
+
+CONTEXT_PREFIX = "Reference for this turn only (background knowledge, do not quote or mention it):\n"
+
+
+@lru_cache(maxsize=None)
+def read_system_prompt(prompt_dir="prompts"):
+    """Static therapist instructions: the opening prompt followed by the per-turn guidance."""
+    initial = Path(prompt_dir, "therapist_initial_prompt.txt").read_text(encoding="utf-8")
+    intermediate = Path(prompt_dir, "therapist_intermediate_prompt.txt").read_text(encoding="utf-8")
+    return f"{initial.strip()}\n\n{intermediate.strip()}"
+
+
+class TherapistChain:
+    """Therapist conversation with a fixed system slot.
+
+    Every call sends ``[system prompt] + history + [turn context] + [patient
+    message]``. The system prompt never changes, so the prefix stays
+    identical between turns (provider / Ollama prompt caching can reuse it).
+    Retrieval context is only sent for the turn it belongs to, and memory
+    stores nothing but the patient's and the therapist's own words.
+    """
+
+    def __init__(self, llm, memory, system_prompt=None):
+        self.llm = llm
+        self.memory = memory
+        self.system_prompt = system_prompt if system_prompt is not None else read_system_prompt()
+
+    def build_messages(self, query="", context=""):
+        messages = [SystemMessage(content=self.system_prompt)]
+        messages += self.memory.load_memory_variables({})[self.memory.memory_key]
+        if context:
+            messages.append(SystemMessage(content=CONTEXT_PREFIX + context))
+        if query:
+            messages.append(HumanMessage(content=query))
+        return messages
+
+    def prompt_text(self, query="", context=""):
+        """What ``run`` would send, flattened to text (for token accounting)."""
+        return get_buffer_string(self.build_messages(query, context))
+
+    def run(self, query="", context=""):
+        """One therapist turn; an empty ``query`` lets the therapist open the conversation."""
+        return self.remember(query, self.llm.invoke(self.build_messages(query, context)))
+
+    async def arun(self, query="", context=""):
+        """``run`` on the model's async client."""
+        return self.remember(query, await self.llm.ainvoke(self.build_messages(query, context)))
+
+    async def astream(self, query="", context=""):
+        """``arun`` yielding the reply chunk by chunk as the model produces it.
+
+        Memory is updated when the stream ends, with whatever was generated if
+        the consumer stops early.
+        """
+        chunks = []
+        try:
+            async for chunk in self.llm.astream(self.build_messages(query, context)):
+                text = getattr(chunk, "content", chunk)
+                if text:
+                    chunks.append(text)
+                    yield text
+        finally:
+            if chunks:
+                self.remember(query, "".join(chunks))
+
+    def remember(self, query, result):
+        response = getattr(result, "content", result).strip()
+        if query:
+            self.memory.save_context({"input": query}, {"response": response})
+        else:
+            self.memory.chat_memory.add_ai_message(response)
+        return response
@@ -9,6 +9,10 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+# The ASGI server keeps one event loop per process, so per-loop async
+# clients are reused across requests.
+os.environ.setdefault('ASYNC_CLIENTS', 'True')
+
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deepheal.settings')
@@ -0,0 +1,50 @@
+import json
+import unittest
+from pathlib import Path
+
+from utils.criteria_generation import merge_disorders
+
+
+CRITERIA_FILE = Path(__file__).resolve().parent.parent / "docs" / "criteria4" / "Somatic Symptom and Related.json"
+
+
+def factitious_disorder():
+    with open(CRITERIA_FILE, "r", encoding="utf-8") as f:
+        return next(each for each in json.load(f) if each["disorder"] == "Factitious Disorder")
+
+
+class MergeDisordersTest(unittest.TestCase):
+    def setUp(self):
+        self.disorder = factitious_disorder()
+        self.lines = self.disorder["criteria"].split("\n")
+
+    def chunk(self, lines):
+        return [{"disorder": self.disorder["disorder"], "criteria": "\n".join(lines)}]
+
+    def test_single_chunk_is_unchanged(self):
+        # Both subtypes share criteria C. and D. word for word; neither may be dropped
+        merged = merge_disorders([[dict(self.disorder)]])
+        self.assertEqual(merged, [self.disorder])
+
+    def test_overlap_at_seam_is_removed(self):
+        split = self.lines.index("") + 1
+        first = self.chunk(self.lines[:split + 2])
+        second = self.chunk(self.lines[split:])
+        merged = merge_disorders([first, second])
+        self.assertEqual(merged[0]["criteria"], self.disorder["criteria"])
+
+    def test_subtypes_in_separate_chunks_keep_repeated_lines(self):
+        split = self.lines.index("")
+        merged = merge_disorders([self.chunk(self.lines[:split]), self.chunk(self.lines[split:])])
+        self.assertEqual(merged[0]["criteria"], self.disorder["criteria"])
+        self.assertEqual(merged[0]["criteria"].count("C. The deceptive behavior"), 2)
+
+    def test_same_disorder_under_another_spelling_is_merged(self):
+        other = [{"disorder": "factitious  disorder", "criteria": "E. Extra line."}]
+        merged = merge_disorders([[dict(self.disorder)], other, ["not a disorder"]])
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(merged[0]["criteria"], self.disorder["criteria"] + "\nE. Extra line.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import json
+import unittest
+
+from utils.json_parsing import clean_json_text, repair_stream
+
+
+class CleanJsonTextTest(unittest.TestCase):
+    def test_inline_fence(self):
+        self.assertEqual(clean_json_text('```json [{"a":1}]```'), '[{"a":1}]')
+        self.assertEqual(clean_json_text('```[{"a":1}]```'), '[{"a":1}]')
+
+    def test_multiline_fence(self):
+        text = '```json\n[\n  {"disorder": "X", "criteria": "A."},\n]\n```\n'
+        self.assertEqual(json.loads(clean_json_text(text)), [{"disorder": "X", "criteria": "A."}])
+
+    def test_fence_split_across_chunks(self):
+        chunks = ["``", "`JSON\n{\"a\": [1, 2,", " ]}\n`", "``"]
+        self.assertEqual(json.loads("".join(repair_stream(chunks))), {"a": [1, 2]})
+
+    def test_strings_are_untouched(self):
+        text = '{"code": "```json x```", "list": "a, ]"}'
+        self.assertEqual(clean_json_text(text), text)
+
+
+if __name__ == "__main__":
+    unittest.main()
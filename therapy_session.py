@@ -20,3 +20,7 @@ while True:
 
     response = therapist.ask(query)
     print(f"AI: {response}\n")
+
+    monitor.routine()
+    if monitor.end_flag:
+        break
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Embedding precision benchmark
+- Embeds the docs/criteria4 corpus once with the full-precision reference model
+- Replays patient queries from logs/conv_*.json through each variant
+- Reports per-query latency and agreement with the reference
+  (query-vector cosine and top-k retrieval overlap)
+
+Usage: EMBED_DEVICE=cpu python -m utils.benchmark_embeddings
+"""
+
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+import numpy as np
+from conversation_agent.load_models import build_embed_model, resolve_device, SENTENCE_TRANSFORMER_EMBED_MODEL
+from conversation_agent.local_index import LocalIndex
+
+
+def load_corpus(input_dir):
+    criteria = []
+    for file_path in sorted(Path(input_dir).glob("*.json")):
+        with open(file_path, "r", encoding="utf-8") as f:
+            criteria.extend(each["criteria"] for each in json.load(f))
+    return criteria
+
+
+def load_queries(log_dir, limit):
+    queries = []
+    for file_path in sorted(Path(log_dir).glob("conv_*.json")):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("role") == "Human" and entry["details"].get("query", "").strip():
+                    queries.append(entry["details"]["query"])
+    return list(dict.fromkeys(queries))[:limit]
+
+
+def time_queries(model, queries):
+    """Encode one query at a time, as Therapist.ask does; returns vectors and latencies."""
+    if not queries:
+        return np.empty((0, 0), dtype=np.float32), []
+    model.encode(queries[0], convert_to_tensor=False)  # warm-up
+    vectors, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        vectors.append(np.asarray(model.encode(query, convert_to_tensor=False), dtype=np.float32))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return LocalIndex.normalize(vectors), latencies
+
+
+def top_k(corpus, queries, k):
+    return np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+
+
+def main():
+    device = resolve_device()
+    corpus_texts = load_corpus(INPUT_DIR)
+    queries = load_queries(LOG_DIR, QUERY_LIMIT)
+    print(f"Device: {device} | Corpus: {len(corpus_texts)} criteria | Queries: {len(queries)}\n")
+    if not queries:
+        print(f"No patient queries found in {LOG_DIR}/conv_*.json (n=0); nothing to time.")
+        return
+
+    reference = build_embed_model(SENTENCE_TRANSFORMER_EMBED_MODEL, device=device, precision="fp32")
+    corpus = LocalIndex.normalize(reference.encode(corpus_texts, batch_size=32, convert_to_tensor=False))
+    ref_queries, ref_latencies = time_queries(reference, queries)
+    ref_top = top_k(corpus, ref_queries, TOP_K)
+    del reference
+
+    rows = [("fp32", ref_latencies, 1.0, 1.0)]
+    for precision in PRECISIONS:
+        try:
+            model = build_embed_model(SENTENCE_TRANSFORMER_EMBED_MODEL, device=device, precision=precision)
+        except Exception as e:
+            print(f"Skipping {precision}: {e}")
+            continue
+        variant_queries, latencies = time_queries(model, queries)
+        cosine = float(np.mean(np.sum(variant_queries * ref_queries, axis=1)))
+        variant_top = top_k(corpus, variant_queries, TOP_K)
+        overlap = float(np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(ref_top, variant_top)]))
+        rows.append((precision, latencies, cosine, overlap))
+        del model
+
+    print(f"\n{'Precision':<10} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'Speedup':>8} {'Cosine':>8} {'Top-' + str(TOP_K):>8}")
+    ref_p50 = statistics.median(ref_latencies)
+    for precision, latencies, cosine, overlap in rows:
+        p50 = statistics.median(latencies)
+        p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+        print(f"{precision:<10} {len(latencies):>5} {p50:>8.2f} {p95:>8.2f} {ref_p50 / p50:>7.2f}x {cosine:>8.4f} {overlap:>8.2%}")
+
+
+# ========= CONFIG =========
+INPUT_DIR = "docs/criteria4"
+LOG_DIR = "logs"
+QUERY_LIMIT = 200
+TOP_K = 5
+PRECISIONS = os.getenv("BENCH_PRECISIONS", "int8,onnx,onnx-int8,bf16").split(",")
+# ==========================
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Incremental offline corpus build
+- PDF -> per-page cache -> chapter text -> LLM criteria -> repaired JSON -> vector index
+- Every target records a fingerprint of its inputs (upstream output hashes,
+  page range, prompt, model, ...) and the hashes of its outputs in
+  BUILD_MANIFEST; a target is rebuilt only when its fingerprint changed or an
+  output is missing or was edited by hand
+- Upstream outputs are fingerprinted by content, so a stage that re-runs but
+  produces identical output does not invalidate the stages below it
+- Independent targets (one chain per chapter) run in parallel
+
+Usage:
+  python -m utils.build                    # build everything that is stale
+  python -m utils.build --dry-run          # list what would be rebuilt
+  python -m utils.build criteria Anxiety   # only targets matching these words (and their deps)
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from utils import pdf_to_text, criteria_generation, json_parsing, create_index
+from utils.llm_cache import LLMCache
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(*parts):
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Target:
+    """One node of the build graph.
+
+    ``inputs()`` returns the values the output depends on (called once the
+    dependencies are built, so it can include their output hashes),
+    ``outputs()`` the files it produces and ``build()`` produces them.
+    """
+
+    def __init__(self, name, build, inputs, outputs, deps=()):
+        self.name = name
+        self.build = build
+        self.inputs = inputs
+        self.outputs = outputs
+        self.deps = list(deps)
+
+
+class Builder:
+    def __init__(self, manifest_file=None, workers=None, dry_run=False):
+        self.manifest_file = Path(manifest_file or BUILD_MANIFEST)
+        self.workers = workers or BUILD_WORKERS
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.targets = {}
+        self.status = {}
+        self.manifest = {}
+        if self.manifest_file.exists():
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def add(self, target):
+        self.targets[target.name] = target
+        return target
+
+    def save_manifest(self):
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.manifest_file)
+
+    def output_hashes(self, target):
+        return {str(path): file_hash(path) for path in target.outputs() if Path(path).exists()}
+
+    def is_current(self, target, key):
+        entry = self.manifest.get(target.name)
+        if not entry or entry["fingerprint"] != key:
+            return False
+        outputs = [str(path) for path in target.outputs()]
+        if not outputs or any(not Path(path).exists() for path in outputs):
+            return False
+        return self.output_hashes(target) == entry["outputs"]
+
+    def run_target(self, target):
+        """Build one target if stale; returns "built", "current" or "stale" (dry run)."""
+        if self.dry_run and any(self.status.get(dep) == "stale" for dep in target.deps):
+            return "stale"
+        key = fingerprint(target.name, target.inputs())
+        if self.is_current(target, key):
+            return "current"
+        if self.dry_run:
+            return "stale"
+        target.build()
+        outputs = self.output_hashes(target)
+        if not outputs:
+            raise RuntimeError(f"{target.name} produced no output")
+        with self.lock:
+            self.manifest[target.name] = {"fingerprint": key, "outputs": outputs}
+            self.save_manifest()
+        return "built"
+
+    def select(self, patterns):
+        """Targets whose name contains every pattern, plus everything they depend on."""
+        if not patterns:
+            return set(self.targets)
+        selected = set()
+        stack = [name for name in self.targets if all(p.lower() in name.lower() for p in patterns)]
+        while stack:
+            name = stack.pop()
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.targets[name].deps)
+        return selected
+
+    def run(self, patterns=()):
+        """Run the selected targets in dependency order, independent ones in parallel."""
+        selected = self.select(patterns)
+        status = self.status = {}
+        running = {}
+
+        def ready(name):
+            return all(status.get(dep) in ("built", "current", "stale") for dep in self.targets[name].deps)
+
+        def blocked(name):
+            return any(status.get(dep) in ("failed", "skipped") for dep in self.targets[name].deps)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while len(status) < len(selected):
+                for name in sorted(selected):
+                    if name in status or name in running.values():
+                        continue
+                    if blocked(name):
+                        status[name] = "skipped"
+                    elif ready(name):
+                        running[pool.submit(self.run_target, self.targets[name])] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as e:
+                        status[name] = "failed"
+                        print(f"Failed {name}: {e}")
+                        continue
+                    if status[name] != "current":
+                        print(f"{status[name].capitalize():<8} {name}")
+
+        counts = {}
+        for state in status.values():
+            counts[state] = counts.get(state, 0) + 1
+        print("Build | " + " | ".join(f"{state.capitalize()}: {n}" for state, n in sorted(counts.items())))
+        return status
+
+
+def llm_model_name(run_fn):
+    parameter = inspect.signature(run_fn).parameters.get("model_name")
+    return parameter.default if parameter else None
+
+
+def define_targets(builder, run_fn=criteria_generation.openai_run, backend="pinecone", cache_mode=None):
+    """The corpus pipeline as build targets, one chain per chapter of the PDF."""
+    pdf_path = Path(pdf_to_text.input_pdf)
+    page_cache = pdf_to_text.PageCache(pdf_path)
+    criteria_folder = criteria_generation.output_folder
+    json_folder = Path(create_index.INPUT_DIR).name
+
+    cache = LLMCache(mode=cache_mode)
+    limited_run_fn = criteria_generation.limited_run(run_fn, cache)
+
+    def upstream(*names):
+        return [builder.manifest.get(name, {}).get("outputs") for name in names]
+
+    pages = builder.add(Target(
+        "pages",
+        build=lambda: page_cache.build(),
+        inputs=lambda: page_cache.fingerprint(),
+        outputs=lambda: [page_cache.text_file, page_cache.index_file],
+    ))
+
+    json_targets = []
+    for chapter, page_range in pdf_to_text.disease_page_dic.items():
+        name = chapter.replace("Disorders", "").strip()
+
+        def build_text(name=name, page_range=page_range):
+            start, end = page_range
+            page_list = [start + pdf_to_text.page_offset, end + pdf_to_text.page_offset if end is not None else None]
+            text = pdf_to_text.pdf_to_text(pdf_path, page_list)
+            criteria_generation.write_atomic(Path(f"docs/disorders/{name}.txt"), text)
+
+        text = builder.add(Target(
+            f"text/{name}",
+            build=build_text,
+            inputs=lambda page_range=page_range: [upstream("pages"), page_range, pdf_to_text.page_offset],
+            outputs=lambda name=name: [Path(f"docs/disorders/{name}.txt")],
+            deps=[pages.name],
+        ))
+
+        def criteria_outputs(name=name):
+            # The LLM answer is saved as .json when it parses, otherwise as .txt
+            return [path for path in (Path(f"docs/{criteria_folder}/{name}.json"), Path(f"docs/{criteria_folder}/{name}.txt")) if path.exists()]
+
+        def build_criteria(name=name):
+            for path in criteria_outputs(name):
+                path.unlink()
+            _, reports = criteria_generation.generate(name, limited_run_fn, cache)
+            print("\n".join(reports[:-1]))
+
+        criteria = builder.add(Target(
+            f"criteria/{name}",
+            build=build_criteria,
+            inputs=lambda text=text: [
+                upstream(text.name),
+                criteria_generation.DIAGNOSTIC_CRITERIA_PROMPT if criteria_generation.criteria else None,
+                criteria_generation.SUMMARY_PROMPT if criteria_generation.summary else None,
+                getattr(run_fn, "__name__", None),
+                llm_model_name(run_fn),
+                criteria_generation.chunk_tokens,
+            ],
+            outputs=criteria_outputs,
+            deps=[text.name],
+        ))
+
+        def build_json(name=name):
+            out_path = Path(f"docs/{json_folder}/{name}.json")
+            if out_path.exists():
+                out_path.unlink()
+            result = json_parsing.repair_file(criteria_outputs(name)[0], out_path)
+            if result["error"]:
+                raise ValueError(f"{result['error']['message']} at line {result['error']['line']}, column {result['error']['column']}")
+
+        json_targets.append(builder.add(Target(
+            f"json/{name}",
+            build=build_json,
+            inputs=lambda criteria=criteria: [upstream(criteria.name), inspect.getsource(json_parsing.repair_stream)],
+            outputs=lambda name=name: [Path(f"docs/{json_folder}/{name}.json")],
+            deps=[criteria.name],
+        )))
+
+    vdb = create_index.VDB(model="SentenceTransformer", backend=backend)
+    builder.add(Target(
+        "index",
+        build=vdb.run,
+        inputs=lambda: [upstream(*(t.name for t in json_targets)), vdb.embed_model_id, vdb.chunking, backend],
+        outputs=lambda: [vdb.stored_file],
+        deps=[t.name for t in json_targets],
+    ))
+    return builder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally build the criteria corpus and vector index.")
+    parser.add_argument("patterns", nargs="*", help="only build targets whose name contains all of these")
+    parser.add_argument("--dry-run", action="store_true", help="list stale targets without building them")
+    parser.add_argument("--workers", type=int, default=None, help="targets built in parallel")
+    parser.add_argument("--backend", default=os.getenv("FETCHER_BACKEND", "pinecone"), help="index backend: pinecone or local")
+    args = parser.parse_args()
+
+    builder = Builder(workers=args.workers, dry_run=args.dry_run)
+    define_targets(builder, backend=args.backend)
+    builder.run(args.patterns)
+
+
+# ========= CONFIG =========
+BUILD_MANIFEST = os.getenv("BUILD_MANIFEST", ".build/manifest.json")
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", "4"))   # targets built in parallel
+# ==========================
+
+
+if __name__ == "__main__":
+    main()
@@ -10,36 +10,54 @@ Purpose:
 
 import os
 from pathlib import Path
-from openai import OpenAI
 import ollama
 import json
+import hashlib
 import unicodedata
 import re
 import sys
 import google.generativeai as genai
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
+import tiktoken
+from pinecone import ServerlessSpec
 from utils.token_count import count_tokens
+from conversation_agent.local_index import LocalIndex, LOCAL_INDEX_DIR
+from conversation_agent.clients import get_index, get_openai_client, get_pinecone_client
+from conversation_agent.embedding_store import get_embedding_store
+from conversation_agent.load_models import build_embed_model, embed_model_id
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class VDB:
-    def __init__(self, model="SentenceTransformer", sample=100):
+    def __init__(self, model="SentenceTransformer", sample=100, backend="pinecone", embed_batch_size=None, upsert_batch_size=None, chunk_tokens=None, chunk_overlap=None):
         self.vdb_dim = 1024
         self.index_name = INDEX_NAME
         if model == "SentenceTransformer":
             self.embed_model = SENTENCE_TRANSFORMER_EMBED_MODEL
+            self.embed_model_id = embed_model_id(self.embed_model)
         elif model == "OpenAI":
             self.embed_model = OPENAI_EMBED_MODEL
+            self.embed_model_id = self.embed_model
         self.model_type = model
         self.model = None
+        self.embedding_store = get_embedding_store(self.embed_model_id)
         self.sample = sample
-        self.stored_file = Path(STORED_FILE)
+        self.backend = backend
+        self.stored_file = Path(STORED_FILE) if backend == "pinecone" else Path(LOCAL_INDEX_DIR) / STORED_FILE
+        self.embed_batch_size = embed_batch_size or EMBED_BATCH_SIZE
+        self.upsert_batch_size = upsert_batch_size or UPSERT_BATCH_SIZE
+        self.chunk_tokens = chunk_tokens or CHUNK_TOKENS
+        self.chunk_overlap = CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        self.chunking = f"{self.chunk_tokens or 'model'}/{self.chunk_overlap}"
+        self.index = None
+        self.stored = None
 
     def ensure_index(self):
         """Create Pinecone index if not exists"""
+        if self.backend == "local":
+            return LocalIndex()
+        pc = get_pinecone_client()
         if self.index_name not in [idx["name"] for idx in pc.list_indexes()]:
             pc.create_index(
                 name=self.index_name,
@@ -47,7 +65,7 @@ class VDB:
                 metric="cosine",
                 spec=ServerlessSpec(cloud="aws", region="us-east-1"),
             )
-        return pc.Index(self.index_name)
+        return get_index(self.index_name)
 
     def read_text_file(self, file_path: Path) -> str:
         """Read file content."""
@@ -58,97 +76,242 @@ class VDB:
             data = json.load(f)
         return data
 
+    def get_index(self):
+        """Resolve the index handle once per run."""
+        if self.index is None:
+            self.index = self.ensure_index()
+        return self.index
+
     def load_stored(self):
-        """Load already stored disorders from file."""
+        """Load the index manifest: disorder -> {hash, model, id, file}.
+
+        The legacy format (a plain list of disorder names) is migrated with an
+        unknown hash, so those entries are re-embedded once.
+        """
         if self.stored_file.exists():
             with open(self.stored_file, "r", encoding="utf-8") as f:
-                return set(json.load(f))
-        return set()
-
-    def update_stored(self, disorder_name):
-        """Add a disorder to the local file."""
-        stored = self.load_stored()
-        stored.add(disorder_name)
-        with open(self.stored_file, "w", encoding="utf-8") as f:
-            json.dump(list(stored), f, indent=2)
+                stored = json.load(f)
+            if isinstance(stored, list):
+                return {name: {"hash": None, "model": None, "id": self.ascii_id(name), "file": None} for name in stored}
+            return stored
+        return {}
+
+    def save_stored(self):
+        self.stored_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.stored_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.stored, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, self.stored_file)
+
+    @staticmethod
+    def entry_ids(entry):
+        """Vector ids of a manifest entry (older manifests hold a single ``id``)."""
+        return entry.get("ids") or [entry["id"]]
+
+    def delete_ids(self, ids, exclude=()):
+        """Delete vector ids not referenced by any manifest entry outside ``exclude``."""
+        live_ids = {vid for name, entry in self.stored.items() if name not in exclude for vid in self.entry_ids(entry)}
+        ids = sorted(set(ids) - live_ids)
+        index = self.get_index()
+        for start in range(0, len(ids), self.upsert_batch_size):
+            index.delete(ids=ids[start:start + self.upsert_batch_size])
+
+    def update_stored(self, entries):
+        """Record a batch of indexed entries in the manifest with a single write;
+        chunks left over from a longer previous version are deleted."""
+        if self.stored is None:
+            self.stored = self.load_stored()
+        stale = []
+        for each in entries:
+            old = self.stored.get(each["disorder"])
+            if old is not None:
+                stale.extend(set(self.entry_ids(old)) - set(each["ids"]))
+            self.stored[each["disorder"]] = {
+                "hash": each["hash"],
+                "model": self.embed_model_id,
+                "chunking": self.chunking,
+                "ids": each["ids"],
+                "file": str(each["file"]),
+            }
+        if stale:
+            self.delete_ids(stale)
+        self.save_stored()
+
+    def remove_stored(self, disorder_names):
+        """Delete vectors whose source entry disappeared and drop them from the manifest."""
+        if self.stored is None:
+            self.stored = self.load_stored()
+        removed = set(disorder_names)
+        self.delete_ids([vid for name in removed for vid in self.entry_ids(self.stored[name])], exclude=removed)
+        for name in disorder_names:
+            print(f"Removed stale disorder: {name}")
+            del self.stored[name]
+        self.save_stored()
+
+    def content_hash(self, criteria):
+        return hashlib.sha256(criteria.encode("utf-8")).hexdigest()
+
+    def is_current(self, disorder_name, criteria_hash):
+        entry = self.stored.get(disorder_name)
+        return (
+            entry is not None
+            and entry["hash"] == criteria_hash
+            and entry["model"] == self.embed_model_id
+            and entry.get("chunking") == self.chunking
+        )
 
     def ascii_id(self, s: str) -> str:
         s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
         s = re.sub(r"[^a-zA-Z0-9_-]", "_", s)
         return s
 
+    def load_model(self):
+        if not self.model:
+            print(f"Initializing Model")
+            self.model = build_embed_model(self.embed_model)
+        return self.model
+
+    def chunk_window(self):
+        """Tokens per chunk: CHUNK_TOKENS, else the model's input window minus special tokens."""
+        if self.chunk_tokens:
+            return self.chunk_tokens
+        if self.model_type == "OpenAI":
+            return OPENAI_MAX_TOKENS
+        return self.load_model().max_seq_length - 2
+
+    def chunk_text(self, text):
+        """Split text into overlapping token-bounded chunks so nothing past the
+        model window is silently truncated. Short texts stay a single chunk."""
+        window = self.chunk_window()
+        step = max(1, window - self.chunk_overlap)
+
+        if self.model_type == "OpenAI":
+            encoding = tiktoken.encoding_for_model(self.embed_model)
+            tokens = encoding.encode(text)
+            if len(tokens) <= window:
+                return [text]
+            starts = range(0, max(1, len(tokens) - self.chunk_overlap), step)
+            return [encoding.decode(tokens[i:i + window]) for i in starts]
+
+        # Slice the original text through the tokenizer's character offsets
+        offsets = self.load_model().tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        if len(offsets) <= window:
+            return [text]
+        starts = range(0, max(1, len(offsets) - self.chunk_overlap), step)
+        return [text[offsets[i][0]:offsets[min(i + window, len(offsets)) - 1][1]] for i in starts]
+
     def embed_text(self, text: str):
         """Create embeddings from text."""
+        return self.embed_texts([text])[0]
+
+    def embed_texts(self, texts):
+        """Create embeddings for a batch of texts, encoding only those missing
+        from the shared embedding store."""
+        return self.embedding_store.get_or_compute_many(texts, self.encode_texts)
+
+    def encode_texts(self, texts):
+        """Run the embedding model on a batch of texts in one model/API call."""
         if self.model_type == "OpenAI":
-            emb = openai_client.embeddings.create(
+            emb = get_openai_client().embeddings.create(
                 model=self.embed_model,
-                input=text
+                input=list(texts)
             )
-            return emb.data[0].embedding
+            return [d.embedding for d in sorted(emb.data, key=lambda d: d.index)]
         elif self.model_type == "SentenceTransformer":
-            if not self.model:
-                print(f"Initializing Model")
-                self.model = SentenceTransformer(self.embed_model, device="cuda")
-            vector = self.model.encode(text, convert_to_tensor=False).tolist()
-            return vector
-
+            vectors = self.load_model().encode(list(texts), batch_size=self.embed_batch_size, convert_to_tensor=False)
+            return vectors.tolist()
 
 
-    def process(self, file_path: Path, isStore=False):
-        """Process one disorder file and upsert into Pinecone."""
+    def collect(self, file_path: Path, seen):
+        """Read one disorder file and return the new or changed entries."""
         disorder_criterias = self.read_json_file(file_path)
-        stored_disorders = self.load_stored()
+        pending = []
 
         for each in disorder_criterias:
             disorder_name = each["disorder"]
 
-            if disorder_name in stored_disorders:
-                print(f"Skipping already stored disorder: {disorder_name}")
+            if disorder_name in seen:
                 continue
+            seen.add(disorder_name)
 
-            self.criteria = each["criteria"]
+            criteria_hash = self.content_hash(each["criteria"])
+            if self.is_current(disorder_name, criteria_hash):
+                continue
 
-            print(f"Disorder: {disorder_name} | Token Count: {count_tokens(self.criteria)}")
+            status = "Changed" if disorder_name in self.stored else "New"
+            print(f"{status} disorder: {disorder_name} | Token Count: {count_tokens(each['criteria'])}")
+            pending.append({"disorder": disorder_name, "criteria": each["criteria"], "file": file_path, "hash": criteria_hash})
+        return pending
 
-            self.embedding = self.embed_text(self.criteria)
+    def process(self, file_path: Path, isStore=False):
+        """Process one disorder file and upsert into the index."""
+        self.stored = self.load_stored()
+        self.process_batch(self.collect(file_path, set()), isStore)
+
+    def process_batch(self, entries, isStore=False):
+        """Chunk and embed entries in batches; upsert and checkpoint once per batch."""
+        for start in range(0, len(entries), self.embed_batch_size):
+            batch = entries[start:start + self.embed_batch_size]
+            for each in batch:
+                each["chunks"] = self.chunk_text(each["criteria"])
+                parent_id = self.ascii_id(each["disorder"])
+                # A single chunk keeps the plain disorder id used before chunking
+                each["ids"] = [parent_id] if len(each["chunks"]) == 1 else [f"{parent_id}#{n}" for n in range(len(each["chunks"]))]
+
+            embeddings = self.embed_texts([chunk for each in batch for chunk in each["chunks"]])
             try:
-                print(f"Embedding dimension: {len(self.embedding)}")
+                print(f"Embedded {len(batch)} disorders ({len(embeddings)} chunks) | Embedding dimension: {len(embeddings[0])}")
             except Exception as e:
                 print(e)
                 sys.exit()
 
             if isStore:
-                self.store(disorder_name, file_path)
-                self.update_stored(disorder_name)
-
-
-    def store(self, disorder_name, file_path: Path):
-        self.index = self.ensure_index()
-        self.index.upsert(
-            vectors=[
-                {
-                    "id": self.ascii_id(disorder_name),
-                    "values": self.embedding,
+                self.store(batch, embeddings)
+                self.update_stored(batch)
+
+
+    def store(self, entries, embeddings):
+        vectors = []
+        embeddings = iter(embeddings)
+        for each in entries:
+            parent_id = self.ascii_id(each["disorder"])
+            for n, vector_id in enumerate(each["ids"]):
+                vectors.append({
+                    "id": vector_id,
+                    "values": next(embeddings),
                     "metadata": {
-                        "file": str(file_path),
-                        "diagnostic_criteria": self.criteria,
+                        "file": str(each["file"]),
+                        "diagnostic_criteria": each["criteria"],
+                        "parent_id": parent_id,
+                        "chunk": n,
                     },
-                }
-            ]
-        )
-        print(f"Stored diagnostic criteria for: {disorder_name}")
+                })
+        index = self.get_index()
+        for start in range(0, len(vectors), self.upsert_batch_size):
+            index.upsert(vectors=vectors[start:start + self.upsert_batch_size])
+        print(f"Stored diagnostic criteria for {len(entries)} disorders ({len(vectors)} vectors)")
 
 
     def run(self):
+        """Incremental rebuild: embed only new or changed criteria and delete
+        vectors whose source entry disappeared."""
         input_dir = Path(INPUT_DIR)
-        count = 0
+        self.stored = self.load_stored()
+        seen = set()
+        pending = []
+        files = sorted(input_dir.glob("*.json"))
 
-        for file_path in input_dir.glob("*.json"):
-            if count == self.sample:
-                break
-            self.process(file_path, isStore=True)
+        for file_path in files[:self.sample]:
+            pending.extend(self.collect(file_path, seen))
 
-            count += 1
+        print(f"Indexing {len(pending)} new or changed disorders from {min(len(files), self.sample)} files")
+        self.process_batch(pending, isStore=True)
+
+        # Only a full pass knows which sources are gone.
+        if len(files) <= self.sample:
+            removed = [name for name in self.stored if name not in seen]
+            if removed:
+                self.remove_stored(removed)
 
 # ========= CONFIG =========
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -160,14 +323,15 @@ INPUT_DIR = "docs/criteria4"   # folder with .txt files
 OPENAI_EMBED_MODEL = "text-embedding-3-large"
 # SENTENCE_TRANSFORMER_EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 SENTENCE_TRANSFORMER_EMBED_MODEL = "BAAI/bge-large-en-v1.5"
+EMBED_BATCH_SIZE = 32      # criteria strings per encode call
+UPSERT_BATCH_SIZE = 100    # vectors per upsert request
+CHUNK_TOKENS = None        # tokens per chunk; None = the embedding model's input window
+CHUNK_OVERLAP = 64         # tokens shared by consecutive chunks
+OPENAI_MAX_TOKENS = 8191
 
 # ==========================
 
-# init clients
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
 
 if __name__ == "__main__":
-    vdb = VDB(model="SentenceTransformer")
+    vdb = VDB(model="SentenceTransformer", backend=os.getenv("FETCHER_BACKEND", "pinecone"))
     vdb.run()
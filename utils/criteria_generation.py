@@ -5,9 +5,14 @@ from openai import OpenAI
 import ollama
 import pandas as pd
 import json
+import re
 import google.generativeai as genai
 from dotenv import load_dotenv
-from utils.token_count import count_tokens
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.token_count import count_tokens, count_tokens_batch
+from utils.rate_limit import RateLimiter, rate_limited
+from utils.llm_cache import LLMCache
+from utils.json_parsing import clean_json_text
 
 
 load_dotenv()
@@ -71,6 +76,118 @@ def read_text_file(file_path: str) -> str:
     """Read the contents of a text file."""
     return Path(file_path).read_text(encoding="utf-8")
 
+def split_sections(text: str) -> list:
+    """Split a chapter at disorder boundaries: the title line right before each
+    "Diagnostic Criteria" heading starts a new section."""
+    lines = text.splitlines(keepends=True)
+    starts = [0]
+    for i, line in enumerate(lines):
+        if line.strip().startswith("Diagnostic Criteria") and i > 0 and i - 1 > starts[-1]:
+            starts.append(i - 1)
+    starts.append(len(lines))
+    return ["".join(lines[a:b]) for a, b in zip(starts, starts[1:]) if a < b]
+
+
+def split_text(text: str, max_tokens: int) -> list:
+    """Pack sections into chunks of at most ``max_tokens`` tokens; a section that
+    is larger on its own is cut on line boundaries."""
+    sections = split_sections(text)
+    pieces = []
+    for section, section_size in zip(sections, count_tokens_batch(sections)):
+        if section_size <= max_tokens:
+            pieces.append((section, section_size))
+            continue
+        block, block_size = "", 0
+        lines = section.splitlines(keepends=True)
+        for line, line_size in zip(lines, count_tokens_batch(lines)):
+            if block and block_size + line_size > max_tokens:
+                pieces.append((block, block_size))
+                block, block_size = "", 0
+            block += line
+            block_size += line_size
+        if block:
+            pieces.append((block, block_size))
+
+    chunks = []
+    chunk = ""
+    chunk_size = 0
+    for piece, piece_size in pieces:
+        if chunk and chunk_size + piece_size > max_tokens:
+            chunks.append(chunk)
+            chunk, chunk_size = "", 0
+        chunk += piece
+        chunk_size += piece_size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def disorder_key(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", name.casefold()).strip()
+
+
+def join_at_seams(parts: list) -> str:
+    """Join texts from consecutive chunks, dropping the lines a part repeats
+    from the end of the previous one (the longest suffix/prefix match).
+    Everything else, including repeats inside a part and blank lines, is kept."""
+    if len(parts) == 1:
+        return parts[0]
+    lines = parts[0].splitlines()
+    for part in parts[1:]:
+        new_lines = part.splitlines()
+        overlap = 0
+        for k in range(min(len(lines), len(new_lines)), 0, -1):
+            if [line.strip() for line in lines[-k:]] == [line.strip() for line in new_lines[:k]]:
+                overlap = k
+                break
+        lines += new_lines[overlap:]
+    return "\n".join(lines)
+
+
+def merge_disorders(chunk_results: list) -> list:
+    """Reduce per-chunk disorder lists into one, deduplicated by normalized
+    name. When a disorder spans chunks, its criteria are joined in chunk order
+    with the overlap at each seam removed; other fields come from its first chunk."""
+    merged = {}
+    parts = {}
+    for disorders in chunk_results:
+        for each in disorders:
+            if not isinstance(each, dict) or not each.get("disorder"):
+                continue
+            key = disorder_key(each["disorder"])
+            if key not in merged:
+                merged[key] = dict(each)
+                parts[key] = []
+            criteria = str(each.get("criteria") or "")
+            if criteria.strip():
+                parts[key].append(criteria)
+    for key, disorder in merged.items():
+        if parts[key]:
+            disorder["criteria"] = join_at_seams(parts[key])
+    return list(merged.values())
+
+
+def extract_criteria_chunked(text: str, prompt_prefix: str, run_fn, max_tokens: int, workers: int):
+    """Map-reduce criteria extraction: one LLM call per chunk, run in parallel,
+    then merged by disorder name. Returns (json_text, input_tokens, failed_chunks)."""
+    prompts = [prompt_prefix + chunk for chunk in split_text(text, max_tokens)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outputs = list(pool.map(run_fn, prompts))
+
+    chunk_results = []
+    failed_chunks = []
+    for n, output in enumerate(outputs):
+        try:
+            data = json.loads(clean_json_text(output))
+            chunk_results.append(data if isinstance(data, list) else [data])
+        except json.JSONDecodeError:
+            failed_chunks.append(n)
+
+    merged = merge_disorders(chunk_results)
+    input_tokens = sum(count_tokens_batch(prompts))
+    return json.dumps(merged, ensure_ascii=False), input_tokens, failed_chunks
+
+
 def process_file(
     disease: str,
     isSummary: bool = True,
@@ -78,6 +195,7 @@ def process_file(
     run_fn=None,
     summary_prompt: str = None,
     criteria_prompt: str = None,
+    chunked: bool = None,
 ) -> dict:
     """
     Process a disorder text file and return structured info.
@@ -89,6 +207,8 @@ def process_file(
         run_fn (callable): function to call for LLM inference (e.g., openai_run, gemma_run, llama_run)
         summary_prompt (str): custom summary prompt (if None, uses default)
         criteria_prompt (str): custom diagnostic criteria prompt (if None, uses default)
+        chunked (bool): extract criteria chunk by chunk (map-reduce); None chooses
+            automatically when the text exceeds `chunk_tokens`
     """
     if run_fn is None:
         raise ValueError("You must provide a run_fn (e.g., openai_run, gemma_run, llama_run).")
@@ -98,20 +218,31 @@ def process_file(
 
     summary = ""
     criteria = ""
+    input_tokens = 0
+    failed_chunks = []
 
     if isSummary:
         prompt = (SUMMARY_PROMPT or summary_prompt or "Summarise this disorder text:\n") + text
         summary = run_fn(prompt)
+        input_tokens = count_tokens(prompt)
 
     if isCriteria:
-        prompt = (DIAGNOSTIC_CRITERIA_PROMPT or criteria_prompt or "Extract diagnostic criteria:\n") + text
-        criteria = run_fn(prompt)
+        prompt_prefix = DIAGNOSTIC_CRITERIA_PROMPT or criteria_prompt or "Extract diagnostic criteria:\n"
+        if chunked is None:
+            chunked = count_tokens(text) > chunk_tokens
+        if chunked:
+            criteria, input_tokens, failed_chunks = extract_criteria_chunked(text, prompt_prefix, run_fn, chunk_tokens, chunk_workers)
+        else:
+            prompt = prompt_prefix + text
+            criteria = run_fn(prompt)
+            input_tokens = count_tokens(prompt)
 
     return {
         "file": file_path,
         "summary": summary,
         "diagnostic_criteria": criteria,
-        "input_tokens": count_tokens(prompt)
+        "input_tokens": input_tokens,
+        "failed_chunks": failed_chunks,
     }
 
 
@@ -121,70 +252,133 @@ criteria = 1
 cap_size = 300
 model_name = "gpt"
 output_folder = "criteria_gpt2"
+concurrency = 4                  # diseases processed in parallel
+requests_per_minute = 500
+tokens_per_minute = 200000
+max_retries = 5
+expected_output_tokens = 4000    # reserved per request in the token budget
+chunk_tokens = 20000             # token budget per chunk in map-reduce extraction
+chunk_workers = 4                # chunks of one document extracted in parallel
+
+
+def write_atomic(path: Path, text: str):
+    """Write via a temp file so a crash never leaves a partial output that looks done."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def cacheable(prompt, response):
+    """Criteria responses are cached only if they parse, so a bad one is asked again on the next run."""
+    if DIAGNOSTIC_CRITERIA_PROMPT and prompt.startswith(DIAGNOSTIC_CRITERIA_PROMPT):
+        try:
+            json.loads(clean_json_text(response))
+        except ValueError:
+            return False
+    return True
+
+
+def limited_run(run_fn, cache):
+    """``run_fn`` behind the rate limiter and, outermost so hits never wait on it, the cache."""
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    return cache.wrap(
+        rate_limited(run_fn, limiter, retries=max_retries, expected_output_tokens=expected_output_tokens),
+        validate=cacheable,
+    )
 
-def main(run_one=None):
-    diseases = [os.path.splitext(filename)[0] for filename in os.listdir("docs/disorders")]
-    done_diseases = [os.path.splitext(filename)[0] for filename in os.listdir(f"docs/{output_folder}")]
 
-    criteria_data = []
-    summary_data = []
-    count = 0
+def generate(disease, run_fn, cache):
+    """Run the LLM for one disease and save its outputs; returns the report lines.
 
-    for disease in diseases:
-        # print(run_one, disease)
-        if run_one and disease.lower().strip() != run_one.lower().strip():
-            # print("Match")
-            continue
+    Raises if a chunk's criteria did not parse: the merge would be missing
+    its disorders, so nothing is saved and the disease is retried on the next run.
+    """
+    result = process_file(disease, summary, criteria, run_fn=run_fn)
+    if result["failed_chunks"]:
+        raise ValueError(f"chunks {result['failed_chunks']} of {disease} not JSON Parsable; nothing saved")
+    text = result["diagnostic_criteria"]
+    l = [disease]
+    reports = []
 
-        if count == cap_size:
-            break
+    if criteria:
+        base_filename = f"docs/{output_folder}/{disease.strip()}"
 
-        if disease in done_diseases and not run_one:
-            continue
+        try:
+            data = json.loads(text)
+            write_atomic(Path(f"{base_filename}.json"), json.dumps(data, indent=4, ensure_ascii=False))
 
-        print(f"Starting {disease}")
+        except json.JSONDecodeError:
+            # Save as .txt
+            write_atomic(Path(f"{base_filename}.txt"), text)
+            reports.append(f"{disease} file not JSON Parsable")
 
-        l = [disease]
-        result = process_file(disease, summary, criteria, run_fn=openai_run)
-        text = result["diagnostic_criteria"]
-        # print("\n=== Summary ===")
-        # print(result["summary"])
-        # print("\n=== Diagnostic Criteria ===")
-        # print(result["diagnostic_criteria"])
+        l += [base_filename, len(text), count_tokens(text)]
+        reports.append(f"Criteria Generated | Disease: {disease} | Characters: {len(text)} | Number of Input Tokens: {result['input_tokens']} | Number of Output Tokens: {count_tokens(text)}")
 
-        if criteria:
-            base_filename = f"docs/{output_folder}/{disease.strip()}"
+    if summary:
+        text = result["summary"]
+        output_txt = f"docs/{output_folder}/{disease.strip()}.txt"
+        write_atomic(Path(output_txt), text)
 
-            try:
-                data = json.loads(text)
-                json_file = Path(f"{base_filename}.json")
-                with json_file.open("w", encoding="utf-8") as f:
-                    json.dump(data, f, indent=4, ensure_ascii=False)
+        l += [output_txt, len(text), count_tokens(text)]
+        reports.append(f"Summary Generated | Disease: {disease} | Characters: {len(text)} | Number of Input Tokens: {result['input_tokens']} | Number of Output Tokens: {count_tokens(text)}")
+
+    reports.append(cache.report())
+    return l, reports
 
-            except json.JSONDecodeError:
-                # Save as .txt
-                txt_file = Path(f"{base_filename}.txt")
-                with txt_file.open("w", encoding="utf-8") as f:
-                    f.write(text)
-                print(f"{disease} file not JSON Parsable")
 
-            l += [base_filename, len(text), count_tokens(text)]
-            criteria_data.append(l)
+def main(run_one=None, run_fn=openai_run, workers=None, cache_mode=None):
+    """Generate outputs for every pending disease with bounded concurrency.
 
-            print(f"Criteria Generated | Disease: {disease} | Characters: {len(text)} | Number of Input Tokens: {result['input_tokens']} | Number of Output Tokens: {count_tokens(text)}")
+    Progress is resumable: each disease's output is written as soon as it
+    finishes, and diseases that already have an output are skipped on rerun.
+    Responses are cached on disk, so re-runs (``run_one``, crash restarts)
+    cost no repeat API calls; pass ``cache_mode="refresh"`` or ``"off"``
+    (or set ``LLM_CACHE``) to bypass it.
+    """
+    diseases = [os.path.splitext(filename)[0] for filename in os.listdir("docs/disorders")]
+    done_diseases = [os.path.splitext(filename)[0] for filename in os.listdir(f"docs/{output_folder}")]
+
+    pending = []
+    for disease in diseases:
+        if run_one and disease.lower().strip() != run_one.lower().strip():
+            continue
+        if disease in done_diseases and not run_one:
+            continue
+        pending.append(disease)
+    pending = pending[:cap_size]
 
-        if summary:
-            output_txt = f"docs/{output_folder}/{disease.strip()}.txt"
-            out_path = Path(output_txt)
-            out_path.write_text(text, encoding="utf-8")
+    cache = LLMCache(mode=cache_mode)
+    limited_run_fn = limited_run(run_fn, cache)
 
-            l += [output_txt, len(text), count_tokens(text)]
-            summary_data.append(l)
+    criteria_data = []
+    summary_data = []
+    failed = []
 
-            print(f"Summary Generated | Disease: {disease} | Characters: {len(text)} | Number of Input Tokens: {result['input_tokens']} | Number of Output Tokens: {count_tokens(text)}")
+    with ThreadPoolExecutor(max_workers=workers or concurrency) as pool:
+        futures = {}
+        for disease in pending:
+            print(f"Starting {disease}")
+            futures[pool.submit(generate, disease, limited_run_fn, cache)] = disease
 
-        count += 1
-        print("\n")
+        for future in as_completed(futures):
+            disease = futures[future]
+            try:
+                l, reports = future.result()
+            except Exception as e:
+                failed.append(disease)
+                print(f"Failed {disease}: {e}\n")
+                continue
+            print("\n".join(reports) + "\n")
+            if criteria:
+                criteria_data.append(l)
+            if summary:
+                summary_data.append(l)
+
+    print(f"Completed {len(pending) - len(failed)}/{len(pending)} diseases")
+    print(cache.report())
+    if failed:
+        print(f"Failed (rerun to resume): {', '.join(failed)}")
 
     # if len(criteria_data) > 0:
     #     criteria_data = pd.DataFrame(criteria_data)
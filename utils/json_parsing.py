@@ -1,85 +1,163 @@
 import json
-import re
 import shutil
 import os
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+def repair_stream(chunks):
+    """Single-pass JSON repair over an iterable of text chunks.
+
+    Outside of string literals it drops a BOM, Markdown code fences (the
+    backticks plus a language tag right after them, such as ```json) and commas that are
+    followed only by whitespace before ``]``, ``}`` or the end of the text.
+    String contents are passed through untouched. Yields cleaned pieces.
+    """
+    in_string = False
+    escape = False
+    ticks = 0
+    tag = False
+    comma = False
+    gap = ""
+
+    for chunk in chunks:
+        out = []
+        for ch in chunk:
+            if in_string:
+                out.append(ch)
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+                continue
+
+            if tag:
+                if ch.isascii() and ch.isalpha():
+                    continue
+                tag = False
+            if ch == "`":
+                ticks += 1
+                if ticks == 3:
+                    ticks = 0
+                    tag = True
+                continue
+            if ticks:
+                out.append("`" * ticks)
+                ticks = 0
+            if ch == "\ufeff":
+                continue
+
+            if comma:
+                if ch.isspace():
+                    gap += ch
+                    continue
+                if ch not in "]}":
+                    out.append(",")
+                out.append(gap)
+                comma, gap = False, ""
+            if ch == ",":
+                comma = True
+                continue
+            if ch == '"':
+                in_string = True
+            out.append(ch)
+        yield "".join(out)
+
+    # A dangling comma at the very end is dropped; trailing whitespace is kept.
+    yield gap
+
 
 def clean_json_text(text: str) -> str:
     """Clean JSON text by fixing common issues like trailing commas or stray annotations."""
-    # Remove BOM if present
-    text = text.lstrip("\ufeff")
-
-    # Remove annotations like ```json and ```
-    text = re.sub(r"^```json", "", text.strip(), flags=re.IGNORECASE | re.MULTILINE)
-    text = re.sub(r"```$", "", text.strip(), flags=re.MULTILINE)
-
-    # Remove trailing commas before ] or }
-    text = re.sub(r",(\s*[\]}])", r"\1", text)
-
-    # Remove dangling commas or braces at end
-    text = text.strip()
-    if text.endswith(","):
-        text = text[:-1]
-    if text.endswith("},"):
-        text = text[:-1] + "}"
+    return "".join(repair_stream([text])).strip()
 
-    return text.strip()
 
+def read_chunks(path, size=1 << 16):
+    with open(path, "r", encoding="utf-8") as f:
+        for chunk in iter(lambda: f.read(size), ""):
+            yield chunk
 
 
-def process_file(input_file: str, output_base: str, input_folder, output_folder):
-    stored = [os.path.splitext(filename)[0] for filename in os.listdir(f"docs/{output_folder}")]
-    if output_base in stored:
-        print(f"File Already Stored.")
-        return
-    
-    input_path = Path(f"docs/{input_folder}/{input_file}.txt")
-    try:
-        raw_text = input_path.read_text(encoding="utf-8")
-    except FileNotFoundError:
-        json_inp_file = os.path.join(f"docs/{input_folder}", f"{input_file}.json")
-        if os.path.exists(json_inp_file):
-            json_out_file = os.path.join(f"docs/{output_folder}", f"{input_file}.json")
-            shutil.copy(json_inp_file, json_out_file)
-            print(f"File Already in JSON format. Copied to Destination Folder!")
-            return
-        else:
-            print(f"File `{json_inp_file}` not found!")
-            return
-
+def repair_file(input_path, output_path) -> dict:
+    """Repair one LLM output file into pretty-printed JSON (or copy it if it is
+    already a .json file). Returns a result record instead of printing."""
+    input_path, output_path = Path(input_path), Path(output_path)
+    result = {"name": input_path.stem, "status": "repaired", "error": None}
+    if input_path.suffix == ".json":
+        shutil.copy(input_path, output_path)
+        result["status"] = "copied"
+        return result
 
+    cleaned_text = "".join(repair_stream(read_chunks(input_path))).strip()
     try:
-        cleaned_text = clean_json_text(raw_text)
-        # print(cleaned_text)
         data = json.loads(cleaned_text)
-
-        json_file = Path(f"docs/{output_folder}/{output_base}.json")
-        with json_file.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-
     except json.JSONDecodeError as e:
-        if 0 <= e.pos < len(cleaned_text):
-            bad_char = cleaned_text[e.pos]
-            print(f"Problematic character: {repr(bad_char)} (Unicode: U+{ord(bad_char):04X})")
-            # Print surrounding context
-            start = max(0, e.pos - 40)
-            end = min(len(cleaned_text), e.pos + 40)
-            print("Context around error:")
-            print(cleaned_text[start:end])
+        start = max(0, e.pos - 40)
+        end = min(len(cleaned_text), e.pos + 40)
+        result["status"] = "failed"
+        result["error"] = {"message": e.msg, "line": e.lineno, "column": e.colno, "context": cleaned_text[start:end]}
+        return result
+
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, output_path)
+    return result
+
+
+def process_batch(input_folder, output_folder, workers=None, run_one=None, force=False) -> list:
+    """Repair every pending file of ``docs/<input_folder>`` into ``docs/<output_folder>``.
+
+    Both folders are scanned once; a name with both a .txt and a .json input
+    uses the .txt. Files are repaired across a process pool and malformed
+    ones are reported together at the end.
+    """
+    input_dir = Path(f"docs/{input_folder}")
+    output_dir = Path(f"docs/{output_folder}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    inputs = {}
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if entry.is_file() and ext in (".txt", ".json") and (ext == ".txt" or stem not in inputs):
+                inputs[stem] = Path(entry.path)
+    with os.scandir(output_dir) as entries:
+        stored = {os.path.splitext(entry.name)[0] for entry in entries}
+
+    pending = []
+    for name in sorted(inputs):
+        if run_one and run_one.lower().strip() != name.lower().strip():
+            continue
+        if name in stored and not (force or run_one):
+            continue
+        pending.append((inputs[name], output_dir / f"{name}.json"))
 
-    except Exception as e:
-        print(f"Failed to parse JSON ({e}). Saved raw text: {output_base}")
+    with ProcessPoolExecutor(max_workers=workers or JSON_WORKERS) as pool:
+        results = list(pool.map(repair_file, *zip(*pending))) if pending else []
 
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(f"JSON Repair | Pending: {len(pending)} | Already Stored: {len(inputs) - len(pending)} | " + " | ".join(f"{status.capitalize()}: {n}" for status, n in sorted(counts.items())))
+    for result in results:
+        if result["error"]:
+            error = result["error"]
+            print(f"  {result['name']}: {error['message']} at line {error['line']}, column {error['column']} | ...{error['context']!r}...")
+    return results
 
-def main(run_one=None):
+
+def main(run_one=None, workers=None):
     input_folder = "criteria_gpt2"
     output_folder = "criteria4"
-    
-    files = [os.path.splitext(filename)[0] for filename in os.listdir(f"docs/{input_folder}")]
-    for file in files:
-        if run_one and run_one.lower().strip() != file.lower().strip():
-            continue
-        process_file(file, file, input_folder, output_folder)
+
+    process_batch(input_folder, output_folder, workers=workers, run_one=run_one)
+
+
+# ========= CONFIG =========
+JSON_WORKERS = os.cpu_count() or 1   # files repaired in parallel
+# ==========================
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+
+
+class LLMCache:
+    """Disk-backed prompt -> response cache for offline LLM runs.
+
+    Entries are keyed by (provider, model, temperature, sha256(prompt)) and
+    stored as one JSON file each under ``cache_dir``. Hits refresh the file's
+    mtime, and the least recently used files are evicted once the cache grows
+    past ``max_bytes``.
+
+    mode:
+        "on"       read and write the cache
+        "refresh"  bypass reads but store fresh responses
+        "off"      bypass the cache entirely
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, mode=None):
+        self.cache_dir = Path(cache_dir or LLM_CACHE_DIR)
+        self.max_bytes = max_bytes or LLM_CACHE_MAX_BYTES
+        self.mode = mode or LLM_CACHE_MODE
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = None
+
+    def make_key(self, provider, model, temperature, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = json.dumps([provider, model, temperature, prompt_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        os.utime(path)  # mark as recently used for eviction
+        return entry["response"]
+
+    def put(self, key, response, meta):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**meta, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if self.total_bytes is not None:
+                self.total_bytes += path.stat().st_size
+        self.evict()
+
+    def entries(self):
+        return [p for p in self.cache_dir.glob("*/*.json")] if self.cache_dir.exists() else []
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(p.stat().st_size for p in self.entries())
+            if self.total_bytes <= self.max_bytes:
+                return
+            files = sorted(self.entries(), key=lambda p: p.stat().st_mtime)
+            for p in files:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                try:
+                    size = p.stat().st_size
+                    p.unlink()
+                    self.total_bytes -= size
+                except FileNotFoundError:
+                    pass
+
+    def wrap(self, run_fn, provider=None, validate=None):
+        """Return ``run_fn`` behind the cache.
+
+        Model and temperature are read from the call's bound arguments (so the
+        function's own defaults, e.g. ``model_name``/``temp``, count), and the
+        provider defaults to the function's name. Responses for which
+        ``validate(prompt, response)`` is false are returned but not stored.
+        """
+        provider = provider or getattr(run_fn, "__name__", "run_fn")
+        signature = inspect.signature(run_fn)
+
+        @functools.wraps(run_fn)
+        def cached_run_fn(prompt, *args, **kwargs):
+            if self.mode == "off":
+                return run_fn(prompt, *args, **kwargs)
+
+            bound = signature.bind(prompt, *args, **kwargs)
+            bound.apply_defaults()
+            params = {name: value for name, value in bound.arguments.items() if name != "prompt"}
+            model = params.pop("model_name", params.pop("model", None))
+            temperature = params.pop("temp", params.pop("temperature", None))
+            key = self.make_key(provider, model, temperature, prompt + (json.dumps(params, sort_keys=True, default=str) if params else ""))
+
+            if self.mode == "on":
+                response = self.get(key)
+                if response is not None:
+                    with self.lock:
+                        self.hits += 1
+                    return response
+
+            with self.lock:
+                self.misses += 1
+            response = run_fn(prompt, *args, **kwargs)
+            if validate is not None and not validate(prompt, response):
+                return response
+            self.put(key, response, {"provider": provider, "model": model, "temperature": temperature})
+            return response
+
+        return cached_run_fn
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self.total_bytes or 0, "mode": self.mode}
+
+    def report(self):
+        stats = self.stats()
+        return f"LLM Cache | Hits: {stats['hits']} | Misses: {stats['misses']} | Size: {stats['bytes'] / 1e6:.1f} MB | Mode: {stats['mode']}"
+
+
+# ========= CONFIG =========
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+LLM_CACHE_MODE = os.getenv("LLM_CACHE", "on")   # "on", "refresh" or "off"
+# ==========================
@@ -3,10 +3,15 @@
 PDF to Text converter
 - Simple usage: set input_pdf, output_txt, and pages_to_extract
 - Uses PyPDF2 (pip install PyPDF2)
+- The PDF is extracted once, in parallel, into a per-page cache (PAGE_CACHE_DIR);
+  chapters are then sliced from the cache instead of re-parsing the PDF
 """
 
 from PyPDF2 import PdfReader
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
 import tiktoken
 import pandas as pd
 from utils.token_count import count_tokens
@@ -42,48 +47,133 @@ disease_page_dic = {
 
 # ===== USER SETTINGS =====
 input_pdf = "docs/DOC-20250318-WA0006._"        
-                
+page_offset = 44                         # printed page number -> PDF page index
+PAGE_CACHE_DIR = "docs/page_cache"       # per-page text cache + page-offset index
+
 # ==========================
 
 
 
-def pdf_to_text(pdf_path: str, page_list=None) -> str:
+def extract_range(job):
+    """Worker: open the PDF once and extract a contiguous page range."""
+    pdf_path, start, end = job
     reader = PdfReader(pdf_path)
     pages = []
-    num_pages = len(reader.pages)
+    for i in range(start, end):
+        try:
+            text = reader.pages[i].extract_text() or ""
+        except Exception as e:
+            print(f"⚠️ Could not extract page {i}: {e}")
+            text = ""
+        pages.append(text)
+    return start, pages
+
+
+class PageCache:
+    """Per-page text of one PDF, extracted once.
+
+    ``<stem>.pages.txt`` holds every page's UTF-8 text back to back and
+    ``<stem>.pages.json`` holds the byte offset range of each page, so any
+    page range can be sliced with one seek and read. The cache is rebuilt
+    when the PDF's size or modification time changes.
+    """
+
+    def __init__(self, pdf_path, cache_dir=None):
+        self.pdf_path = Path(pdf_path)
+        cache_dir = Path(cache_dir or PAGE_CACHE_DIR)
+        self.text_file = cache_dir / f"{self.pdf_path.stem}.pages.txt"
+        self.index_file = cache_dir / f"{self.pdf_path.stem}.pages.json"
+        self.offsets = None
+
+    def fingerprint(self):
+        stat = self.pdf_path.stat()
+        return {"pdf": str(self.pdf_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def load(self):
+        """Load the page index, returning False if it is missing or stale."""
+        if not (self.index_file.exists() and self.text_file.exists()):
+            return False
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index["fingerprint"] != self.fingerprint():
+            return False
+        self.offsets = index["offsets"]
+        return True
+
+    def build(self, workers=None):
+        """Extract all pages in one pass, fanning page ranges out over a process pool."""
+        num_pages = len(PdfReader(self.pdf_path).pages)
+        workers = workers or os.cpu_count() or 1
+        step = max(1, -(-num_pages // (workers * 4)))
+        jobs = [(str(self.pdf_path), start, min(start + step, num_pages)) for start in range(0, num_pages, step)]
+
+        pages = [""] * num_pages
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for start, texts in pool.map(extract_range, jobs):
+                pages[start:start + len(texts)] = texts
+
+        self.text_file.parent.mkdir(parents=True, exist_ok=True)
+        self.offsets = []
+        position = 0
+        with open(self.text_file, "wb") as f:
+            for text in pages:
+                data = text.encode("utf-8")
+                f.write(data)
+                self.offsets.append([position, position + len(data)])
+                position += len(data)
+        with open(self.index_file, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint(), "offsets": self.offsets}, f)
+        print(f"✅ Cached {num_pages} pages of '{self.pdf_path}' in '{self.text_file}'")
+
+    def ensure(self, workers=None):
+        if self.offsets is None and not self.load():
+            self.build(workers)
+        return self
+
+    @property
+    def num_pages(self):
+        return len(self.ensure().offsets)
+
+    def pages(self, start, end):
+        """Texts of pages ``start..end`` inclusive, read with a single seek."""
+        self.ensure()
+        if start > end:
+            return []
+        with open(self.text_file, "rb") as f:
+            f.seek(self.offsets[start][0])
+            data = f.read(self.offsets[end][1] - self.offsets[start][0])
+        base = self.offsets[start][0]
+        return [data[a - base:b - base].decode("utf-8") for a, b in self.offsets[start:end + 1]]
+
+
+def pdf_to_text(pdf_path: str, page_list=None) -> str:
+    cache = PageCache(pdf_path).ensure()
+    num_pages = cache.num_pages
 
     if not page_list:  # If no page list, take all
         page_list = [0,num_pages-1]
 
-    if page_list[1] is None:
-        page_list[1] = num_pages-1
+    start, end = page_list[0], page_list[1]
+    if end is None:
+        end = num_pages-1
 
-    for i in range(page_list[0], page_list[1]+1):
+    for i in range(start, end+1):
         if i < 0 or i >= num_pages:
             print(f"⚠️ Skipping invalid page index: {i}")
-            continue
-        try:
-            text = reader.pages[i].extract_text() or ""
-        except Exception as e:
-            print(f"⚠️ Could not extract page {i}: {e}")
-            text = ""
-        pages.append(text)
 
+    pages = cache.pages(max(start, 0), min(end, num_pages-1))
     return "\n".join(pages)
 
 def main():
     pdf_path = Path(input_pdf)
+    PageCache(pdf_path).ensure()
 
     data = []
 
     for disease in disease_page_dic:
         pages_to_extract = disease_page_dic[disease]
         l = [disease] + pages_to_extract
-        pages_to_extract[0] = pages_to_extract[0] + 44
-        try:
-            pages_to_extract[1] = pages_to_extract[1] + 44
-        except TypeError:
-            pass
+        pages_to_extract = [pages_to_extract[0] + page_offset, pages_to_extract[1] + page_offset if pages_to_extract[1] is not None else None]
         output_txt = f"docs/disorders/{disease.replace('Disorders','').strip()}.txt"
         out_path = Path(output_txt)
 
@@ -1,12 +1,14 @@
 import os
 import datetime
 import asyncio
+from pathlib import Path
 from moviepy import AudioFileClip
 from moviepy import VideoFileClip
 import whisper
 
 
-def process_media():
+def process_media(audio_path=None, video_path=None):
+    """Convert an uploaded recording; without paths, the newest files in media/ are used."""
     parent_folder_path = "media/"
     output_path = "media/processed/"
 
@@ -20,26 +22,36 @@ def process_media():
     #     process_video(parent_folder_path, output_path)
     # )
 
-    file_aud = process_audio(parent_folder_path, output_path)
-    file_vid = process_video(parent_folder_path, output_path)
+    if audio_path is None and video_path is None:
+        file_aud = process_audio(parent_folder_path, output_path)
+        file_vid = process_video(parent_folder_path, output_path)
+    else:
+        # Only this upload's own files, never another recording in the folder
+        file_aud = process_audio(parent_folder_path, output_path, audio_path) if audio_path else None
+        file_vid = process_video(parent_folder_path, output_path, video_path) if video_path else None
     return file_aud, file_vid
 
-def process_audio(parent_folder_path, output_path):
-    folder_path = f"{parent_folder_path}/audio"
-    webm_files = [f for f in os.listdir(folder_path) if f.endswith(".webm")]
-    
-    if not webm_files:
-        print("No .webm files found!")
-        return
+def process_audio(parent_folder_path, output_path, input_path=None):
+    if input_path is not None:
+        # Named after the (unique) upload, so concurrent requests never share a file
+        latest_file_path = str(input_path)
+        output_file = f"{output_path}/{Path(input_path).stem}.mp3"
+    else:
+        folder_path = f"{parent_folder_path}/audio"
+        webm_files = [f for f in os.listdir(folder_path) if f.endswith(".webm")]
 
-    webm_files.sort() 
-    latest_file = webm_files[-1]
+        if not webm_files:
+            print("No .webm files found!")
+            return
 
-    latest_file_path = os.path.join(folder_path, latest_file)
+        webm_files.sort()
+        latest_file = webm_files[-1]
 
-    processed_files = [f for f in os.listdir(output_path)]
-    num = len(processed_files)//2 + 1
-    output_file = f"{output_path}/audio{num}.mp3"
+        latest_file_path = os.path.join(folder_path, latest_file)
+
+        processed_files = [f for f in os.listdir(output_path)]
+        num = len(processed_files)//2 + 1
+        output_file = f"{output_path}/audio{num}.mp3"
 
     audio_clip = AudioFileClip(latest_file_path)
     audio_clip.write_audiofile(output_file)
@@ -56,23 +68,27 @@ def audio_to_text(file):
 
 
 
-def process_video(parent_folder_path, output_path):
-    folder_path = f"{parent_folder_path}/video"
-    webm_files = [f for f in os.listdir(folder_path) if f.endswith(".webm")]
-    # print(f"Found {len(webm_files)} .webm files.")
-    
-    if not webm_files:
-        print("No .webm files found!")
-        return
+def process_video(parent_folder_path, output_path, input_path=None):
+    if input_path is not None:
+        latest_file_path = str(input_path)
+        output_file = f"{output_path}/{Path(input_path).stem}.mp4"
+    else:
+        folder_path = f"{parent_folder_path}/video"
+        webm_files = [f for f in os.listdir(folder_path) if f.endswith(".webm")]
+        # print(f"Found {len(webm_files)} .webm files.")
+
+        if not webm_files:
+            print("No .webm files found!")
+            return
 
-    webm_files.sort() 
-    latest_file = webm_files[-1]
+        webm_files.sort()
+        latest_file = webm_files[-1]
 
-    latest_file_path = os.path.join(folder_path, latest_file)
+        latest_file_path = os.path.join(folder_path, latest_file)
 
-    processed_files = [f for f in os.listdir(output_path)]
-    num = len(processed_files)//2 + 1
-    output_file = f"{output_path}/video{num}.mp4"
+        processed_files = [f for f in os.listdir(output_path)]
+        num = len(processed_files)//2 + 1
+        output_file = f"{output_path}/video{num}.mp4"
 
     clip = VideoFileClip(latest_file_path)
     clip.write_videofile(output_file, codec="libx264", audio_codec="aac")
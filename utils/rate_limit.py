@@ -0,0 +1,75 @@
+import functools
+import random
+import threading
+import time
+from utils.token_count import count_tokens
+
+
+class RateLimiter:
+    """Thread-safe token bucket over requests/minute and tokens/minute.
+
+    ``acquire(tokens)`` blocks until both budgets allow one more request of
+    that size. A limit of ``None`` disables that budget.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.request_budget = float(requests_per_minute or 0)
+        self.token_budget = float(tokens_per_minute or 0)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        if self.rpm:
+            self.request_budget = min(self.rpm, self.request_budget + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.token_budget = min(self.tpm, self.token_budget + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens=0):
+        # A single request larger than the whole minute budget still has to go through
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        while True:
+            with self.lock:
+                self.refill()
+                wait = 0.0
+                if self.rpm and self.request_budget < 1:
+                    wait = max(wait, (1 - self.request_budget) * 60 / self.rpm)
+                if self.tpm and self.token_budget < tokens:
+                    wait = max(wait, (tokens - self.token_budget) * 60 / self.tpm)
+                if wait == 0.0:
+                    if self.rpm:
+                        self.request_budget -= 1
+                    if self.tpm:
+                        self.token_budget -= tokens
+                    return
+            time.sleep(wait)
+
+
+def retry_with_backoff(fn, *args, retries=5, base_delay=2.0, max_delay=60.0, **kwargs):
+    """Call fn, retrying failures with exponential backoff and full jitter."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"Attempt {attempt + 1} failed ({type(e).__name__}: {e}). Retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def rate_limited(run_fn, limiter, retries=5, expected_output_tokens=0):
+    """Wrap an LLM ``run_fn(prompt)`` with rate limiting and retries."""
+    @functools.wraps(run_fn)
+    def wrapped(prompt, *args, **kwargs):
+        def attempt():
+            limiter.acquire(count_tokens(prompt) + expected_output_tokens)
+            return run_fn(prompt, *args, **kwargs)
+        return retry_with_backoff(attempt, retries=retries)
+
+    return wrapped
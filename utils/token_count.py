@@ -1,8 +1,82 @@
+import threading
+from functools import lru_cache
 import tiktoken
 
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o-mini"):
+    """Load the tokenizer for a model once per process."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Non-OpenAI models (e.g. Ollama tags) fall back to the gpt-4o tokenizer
+        return tiktoken.get_encoding("o200k_base")
+
+
 def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
     # Load the tokenizer for the model
-    encoding = tiktoken.encoding_for_model(model)
+    encoding = get_encoding(model)
     # Encode text into tokens
     tokens = encoding.encode(text)
-    return len(tokens)
\ No newline at end of file
+    return len(tokens)
+
+
+def encode_batch(texts, model: str = "gpt-4o-mini", num_threads: int = 8):
+    """Encode many texts in one call (tiktoken parallelises the batch).
+
+    Small batches are encoded in a loop: tiktoken starts a thread pool per
+    ``encode_batch`` call, which costs more than it saves on a few strings.
+    """
+    texts = list(texts)
+    encoding = get_encoding(model)
+    if len(texts) < MIN_PARALLEL_BATCH:
+        return [encoding.encode(text) for text in texts]
+    return encoding.encode_batch(texts, num_threads=num_threads)
+
+
+def count_tokens_batch(texts, model: str = "gpt-4o-mini") -> list:
+    return [len(tokens) for tokens in encode_batch(texts, model)]
+
+
+class TokenLedger:
+    """Running per-session token totals.
+
+    Callers record each exchange once and reuse the returned counts for their
+    logs; monitors read the totals instead of re-tokenizing the conversation.
+    """
+
+    def __init__(self, model: str = "gpt-4o-mini"):
+        self.model = model
+        self.lock = threading.Lock()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+
+    def record(self, input_text: str = "", output_text: str = ""):
+        """Count input and output, add them to the totals and return them."""
+        input_count = count_tokens(input_text or "", self.model)
+        output_count = count_tokens(output_text or "", self.model)
+        with self.lock:
+            self.input_tokens += input_count
+            self.output_tokens += output_count
+            self.calls += 1
+        return input_count, output_count
+
+    @property
+    def total_tokens(self) -> int:
+        with self.lock:
+            return self.input_tokens + self.output_tokens
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.input_tokens + self.output_tokens,
+                "calls": self.calls,
+            }
+
+
+# ========= CONFIG =========
+MIN_PARALLEL_BATCH = 16   # smaller batches skip tiktoken's per-call thread pool
+# ==========================
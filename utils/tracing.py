@@ -0,0 +1,138 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+
+_current = contextvars.ContextVar("trace_spans", default=None)
+_histograms = {}
+_lock = threading.Lock()
+_null_span = nullcontext()
+
+
+class Histogram:
+    """Latency histogram over fixed, doubling millisecond buckets."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile."""
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class Trace(Span):
+    """Span that also collects every span closed inside it into ``spans``."""
+
+    __slots__ = ("spans", "token")
+
+    def __enter__(self):
+        self.spans = {}
+        self.token = _current.set(self.spans)
+        super().__enter__()
+        return self.spans
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        _current.reset(self.token)
+        return False
+
+
+def record(name, ms):
+    """Add a duration to the current trace (if any) and to the process-wide histogram."""
+    spans = _current.get()
+    if spans is not None:
+        spans[name] = round(spans.get(name, 0.0) + ms, 3)
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(ms)
+
+
+def span(name):
+    """Time a block: ``with span("fetch.query"): ...``. A shared no-op when tracing is off."""
+    if not TRACING:
+        return _null_span
+    return Span(name)
+
+
+def trace(name):
+    """Time a block and collect its spans: ``with trace("turn") as spans: ...``.
+
+    ``spans`` is a dict of span name -> total milliseconds, or ``None`` when
+    tracing is off.
+    """
+    if not TRACING:
+        return _null_span
+    return Trace(name)
+
+
+def set_tracing(enabled):
+    global TRACING
+    TRACING = bool(enabled)
+
+
+def snapshot():
+    with _lock:
+        return {name: histogram.snapshot() for name, histogram in sorted(_histograms.items())}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def report():
+    lines = [f"{'Span':<20} {'Count':>6} {'Mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'Max ms':>9}"]
+    for name, stats in snapshot().items():
+        lines.append(f"{name:<20} {stats['count']:>6} {stats['mean_ms']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    return "\n".join(lines)
+
+
+# ========= CONFIG =========
+TRACING = os.getenv("TRACING", "False").lower() in ("true", "1", "t")
+BUCKETS_MS = [0.1 * 2 ** i for i in range(20)]   # 0.1 ms .. ~52 s
+# ==========================